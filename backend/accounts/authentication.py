@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import TTLCache
+
+# token key -> (user, token). The user is loaded together with its
+# SharePoint credentials so SharePointService does not query them again.
+token_cache = TTLCache(
+    max_size=getattr(settings, 'AUTH_TOKEN_CACHE_MAX_SIZE', 1024),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300),
+)
+
+
+def invalidate_user(user_id):
+    """
+    Drops every cached token entry belonging to the given user.
+    """
+    return token_cache.delete_where(lambda key, value: value[0].pk == user_id)
+
+
+def invalidate_token(key):
+    token_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication backed by an in-process LRU/TTL cache of
+    token -> user (+ SharePoint credentials).
+
+    Entries are invalidated by the signal handlers in accounts.signals
+    whenever a token, user or credentials row changes.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        model = self.get_model()
+        try:
+            token = model.objects.select_related(
+                'user', 'user__sharepoint_credentials'
+            ).get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        result = (token.user, token)
+        token_cache.set(key, result)
+        return result
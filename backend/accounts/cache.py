@@ -0,0 +1,121 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache with LRU eviction and a per-entry TTL.
+    Used for hot-path lookups that would otherwise hit the database or Graph
+    on every request.
+    """
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """
+        Removes every entry for which predicate(key, value) is true.
+        """
+        with self._lock:
+            stale = [k for k, (v, _) in self._data.items() if predicate(k, v)]
+            for k in stale:
+                del self._data[k]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedCache:
+    """
+    TTLCache-like wrapper around a Django cache backend (settings.CACHES), for
+    state that every worker process must see, e.g. caches invalidated by a
+    webhook that only one worker receives.
+
+    Keys may be any repr()-able value; they are hashed so memcached and
+    friends accept them. Entries can be grouped into scopes that are dropped
+    together with invalidate_scope(): backends cannot delete by prefix, so
+    each scope has a random token that is part of its entries' keys and a new
+    token orphans them.
+    """
+    def __init__(self, alias='default', prefix='shared', ttl=300):
+        self.alias = alias
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _hash(self, key):
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _scope_keys(self, scopes):
+        return [f"{self.prefix}:scope:{self._hash(scope)}" for scope in scopes]
+
+    def _tokens(self, scopes):
+        scope_keys = self._scope_keys(scopes)
+        found = self.cache.get_many(scope_keys)
+        tokens = []
+        for scope_key in scope_keys:
+            token = found.get(scope_key)
+            if token is None:
+                # add() so concurrent workers agree on one token
+                self.cache.add(scope_key, uuid.uuid4().hex, timeout=None)
+                token = self.cache.get(scope_key)
+            tokens.append(token)
+        return tokens
+
+    def make_key(self, key, scopes=()):
+        tokens = self._tokens(scopes) if scopes else []
+        return f"{self.prefix}:{self._hash((key, tokens))}"
+
+    def get(self, key, default=None, scopes=()):
+        return self.cache.get(self.make_key(key, scopes), default)
+
+    def set(self, key, value, ttl=None, scopes=()):
+        self.cache.set(self.make_key(key, scopes), value, timeout=self.ttl if ttl is None else ttl)
+
+    def delete(self, key, scopes=()):
+        self.cache.delete(self.make_key(key, scopes))
+
+    def invalidate_scope(self, scope):
+        self.cache.set(self._scope_keys([scope])[0], uuid.uuid4().hex, timeout=None)
+
+    def clear(self):
+        # Clears the whole backend, so give shared caches an alias of their own
+        self.cache.clear()
@@ -1,20 +1,22 @@
-import msal
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# Sites.Read.All is needed to enumerate followed sites and their libraries
+GRAPH_SCOPES = ["User.Read", "Files.Read", "Sites.Read.All"]
 
-def get_msal_app():
+def get_msal_app(timeout=None):
+    # msal pulls in cryptography/jwt; only pay for it when a token is needed
+    import msal
     return msal.ConfidentialClientApplication(
         os.getenv("SHAREPOINT_CLIENT_ID"),
         authority=f"https://login.microsoftonline.com/{os.getenv('SHAREPOINT_TENANT_ID')}",
-        client_credential=os.getenv("SHAREPOINT_CLIENT_SECRET")
+        client_credential=os.getenv("SHAREPOINT_CLIENT_SECRET"),
+        timeout=timeout
     )
 
 def get_auth_url(redirect_uri):
     app = get_msal_app()
     return app.get_authorization_request_url(
-        ["User.Read", "Files.Read"],
+        GRAPH_SCOPES,
         redirect_uri=redirect_uri
     )
 
@@ -22,6 +24,6 @@ def acquire_token_by_code(code, redirect_uri):
     app = get_msal_app()
     return app.acquire_token_by_authorization_code(
         code,
-        scopes=["User.Read", "Files.Read"],
+        scopes=GRAPH_SCOPES,
         redirect_uri=redirect_uri
     )
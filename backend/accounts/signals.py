@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user
+from .models import SharePointCredentials
+
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+    invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=SharePointCredentials)
+def credentials_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
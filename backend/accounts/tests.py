@@ -1,3 +1,88 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from .authentication import CachedTokenAuthentication, token_cache
+from .models import SharePointCredentials
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(username="user@example.com")
+        SharePointCredentials.objects.create(user=self.user, access_token="old-token")
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.auth.authenticate_credentials(self.token.key)
+
+    def test_cache_hit_makes_no_queries(self):
+        with self.assertNumQueries(1):
+            user, token = self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+            # Credentials were loaded with the user
+            self.assertEqual(user.sharepoint_credentials.access_token, "old-token")
+        self.assertEqual(token, self.token)
+
+    def test_token_delete_invalidates(self):
+        self.authenticate()
+        self.token.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_user_save_invalidates(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_user_delete_invalidates(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_credentials_save_invalidates(self):
+        self.authenticate()
+        credentials = SharePointCredentials.objects.get(user=self.user)
+        credentials.access_token = "new-token"
+        credentials.save()
+        user, _ = self.authenticate()
+        self.assertEqual(user.sharepoint_credentials.access_token, "new-token")
+
+    def test_credentials_delete_invalidates(self):
+        self.authenticate()
+        SharePointCredentials.objects.filter(user=self.user).delete()
+        user, _ = self.authenticate()
+        self.assertFalse(SharePointCredentials.objects.filter(user=user).exists())
+        with self.assertRaises(SharePointCredentials.DoesNotExist):
+            user.sharepoint_credentials
+
+    @mock.patch("accounts.views.subscribe_in_background")
+    @mock.patch("accounts.views.acquire_token_by_code")
+    def test_relogin_invalidates(self, acquire_token_by_code, subscribe_in_background):
+        self.authenticate()
+        acquire_token_by_code.return_value = {
+            "id_token_claims": {"preferred_username": self.user.username},
+            "access_token": "new-token",
+            "refresh_token": "refresh",
+            "expires_in": 3600,
+        }
+        response = self.client.post(
+            reverse("ms-callback"),
+            {"code": "code", "redirect_uri": "http://localhost/callback"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["token"], self.token.key)
+        subscribe_in_background.assert_called_once()
 
-# Create your tests here.
+        user, _ = self.authenticate()
+        self.assertEqual(user.sharepoint_credentials.access_token, "new-token")
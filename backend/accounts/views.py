@@ -7,6 +7,8 @@ from django.utils import timezone
 from datetime import timedelta
 from .models import SharePointCredentials
 from .msal_client import get_auth_url, acquire_token_by_code
+from .authentication import invalidate_user
+from connectors.notifications import subscribe_in_background
 import logging
 
 logger = logging.getLogger(__name__)
@@ -64,6 +66,12 @@ class MsCallbackView(APIView):
             }
         )
 
+        # Re-login: drop any cached auth entry so the fresh credentials are used
+        invalidate_user(user.pk)
+
+        # Push-based cache invalidation for the user's drives
+        subscribe_in_background(user)
+
         # Generate App Token
         token, _ = Token.objects.get_or_create(user=user)
 
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{6}-[a-z0-9_]+-[0-9a-f]{8}$")
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for a single thread.
+
+    A daemon thread wakes every `interval` seconds, grabs the target thread's
+    current stack from sys._current_frames() and counts it. The result is in
+    collapsed-stack format ("outer;inner;leaf count" per line), which
+    flamegraph.pl and speedscope read directly.
+
+    The sampler needs the GIL to take a sample, so when other threads hold
+    it (e.g. openpyxl parsing in a pool thread) samples arrive late. The mean
+    observed interval is recorded as a rough GIL-contention signal.
+    """
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._labels = {}
+        self._gaps = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.duration = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._gaps.append(now - last)
+            last = now
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = self._label(code)
+                stack.append(label)
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    @staticmethod
+    def _label(code):
+        path = code.co_filename
+        for prefix in sys.path:
+            if prefix and path.startswith(prefix):
+                path = path[len(prefix):].lstrip(os.sep)
+                break
+        return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def stats(self):
+        mean_gap = sum(self._gaps) / len(self._gaps) if self._gaps else None
+        return {
+            "duration": self.duration,
+            "samples": sum(self.samples.values()),
+            "interval": self.interval,
+            "mean_sample_interval": mean_gap,
+        }
+
+
+def should_profile(request):
+    """
+    Staff can ask for a profile with the X-Profile header; otherwise a
+    PROFILE_SAMPLE_RATE fraction of requests is profiled. Both checks are a
+    dict lookup when profiling is off.
+    """
+    if request.headers.get('X-Profile') and request.user.is_staff:
+        return True
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def save_profile(profiler, request, response, view_name):
+    """
+    Writes <id>.collapsed and <id>.json (request metadata) to PROFILE_DIR and
+    prunes the directory down to PROFILE_MAX_FILES profiles.
+    """
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    now = timezone.now()
+    profile_id = f"{now:%Y%m%dT%H%M%S}-{view_name.lower()}-{uuid.uuid4().hex[:8]}"
+    meta = {
+        "id": profile_id,
+        "created_at": now.isoformat(),
+        "view": view_name,
+        "method": request.method,
+        "path": request.get_full_path(),
+        "user": request.user.get_username() if request.user.is_authenticated else None,
+        "status": response.status_code,
+        **profiler.stats(),
+    }
+    (directory / f"{profile_id}.collapsed").write_text(profiler.collapsed())
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta))
+
+    prune_profiles(getattr(settings, 'PROFILE_MAX_FILES', 50))
+    return profile_id
+
+
+def list_profiles():
+    """
+    Metadata of the stored profiles, newest first.
+    """
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_path(profile_id):
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}.collapsed"
+    return path if path.exists() else None
+
+
+def prune_profiles(keep):
+    for meta in list_profiles()[keep:]:
+        for suffix in (".collapsed", ".json"):
+            try:
+                (profile_dir() / f"{meta['id']}{suffix}").unlink()
+            except (OSError, KeyError):
+                pass
+
+
+class ProfilingMixin:
+    """
+    Opt-in per-request profiling for APIViews. Profiling starts once DRF has
+    authenticated the request (so staff can be told apart) and stops when the
+    response is finalized; the profile id is returned in X-Profile-Id.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if should_profile(request):
+            self._profiler = SamplingProfiler(
+                interval=getattr(settings, 'PROFILE_INTERVAL', 0.005)
+            ).start()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        profiler = getattr(self, '_profiler', None)
+        if profiler is not None:
+            self._profiler = None
+            profiler.stop()
+            try:
+                response['X-Profile-Id'] = save_profile(profiler, request, response, type(self).__name__)
+            except OSError as e:
+                logger.error(f"Could not save profile: {e}")
+        return response
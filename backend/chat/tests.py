@@ -1,3 +1,213 @@
-from django.test import TestCase
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from accounts.authentication import token_cache
+from accounts.models import SharePointCredentials
+from config.middleware import accepts_br
+from .profiling import should_profile
+from connectors.deadline import DeadlineExceeded
+from connectors.sharepoint_service import listing_etag
+
+# Stands in for the optional brotli package, which may not be installed
+fake_brotli = SimpleNamespace(compress=lambda data, quality=None: zlib.compress(data))
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(username="user@example.com")
+        SharePointCredentials.objects.create(user=self.user, access_token="token")
+        self.token = Token.objects.create(user=self.user)
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_AUTHORIZATION=f"Token {self.token.key}", **headers)
+
+    def post(self, url, data, **headers):
+        return self.client.post(
+            url, data, content_type="application/json", HTTP_AUTHORIZATION=f"Token {self.token.key}", **headers
+        )
+
+
+class AcceptsBrTests(SimpleTestCase):
+    def test_q_values(self):
+        self.assertTrue(accepts_br("gzip, deflate, br"))
+        self.assertTrue(accepts_br("br;q=0.5, gzip"))
+        self.assertTrue(accepts_br("BR ; q=1"))
+        self.assertFalse(accepts_br("gzip, br;q=0"))
+        self.assertFalse(accepts_br("br; q=0.0"))
+        self.assertFalse(accepts_br("gzip, deflate"))
+        self.assertFalse(accepts_br("brotli"))
+        self.assertFalse(accepts_br(""))
+
+
+class ListingETagTests(APITestCase):
+    files = [{"id": f"file-{i}", "name": f"Report {i}.xlsx", "type": "file"} for i in range(20)]
+
+    def setUp(self):
+        super().setUp()
+        self.etag = listing_etag(self.files)
+        patcher = mock.patch(
+            "chat.views.SharePointService.get_listing", return_value=(self.files, self.etag)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse("sharepoint-files")
+
+    def test_etag_and_not_modified(self):
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        response = self.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_changed_etag_returns_listing(self):
+        response = self.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["files"]), 20)
+
+    def test_gzip_weakened_etag_revalidates(self):
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], "W/" + self.etag)
+
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch("config.middleware.brotli", fake_brotli)
+    def test_br_weakened_etag_revalidates(self):
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["ETag"], "W/" + self.etag)
+
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch("config.middleware.brotli", fake_brotli)
+    def test_refused_br_falls_back_to_gzip(self):
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+
+def slow_file_content(file_id=None, download_url=None, drive_id=None, deadline=None):
+    """
+    get_file_content stand-in: "hang" runs into its deadline like a stalled
+    download, "late" returns just after its deadline, anything else at once.
+    """
+    if file_id == "hang":
+        time.sleep(deadline.remaining())
+        raise DeadlineExceeded("download")
+    if file_id == "late":
+        time.sleep(deadline.remaining() + 0.01)
+    return f"contents of {file_id}".encode()
+
+
+@override_settings(CHAT_REQUEST_TIMEOUT=2, CHAT_LLM_MIN_BUDGET=1)
+class ChatBudgetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.llm = mock.Mock()
+        self.llm.answer_with_context.return_value = "answer"
+        for patcher in (
+            mock.patch("chat.views.get_llm_service", return_value=self.llm),
+            mock.patch("chat.views.SharePointService.get_file_content", side_effect=slow_file_content),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.url = reverse("chat-message")
+
+    def ask(self, *file_ids):
+        files = [{"id": file_id, "name": f"{file_id}.txt"} for file_id in file_ids]
+        return self.post(self.url, {"message": "summarize", "context_files": files})
+
+    def context(self):
+        return self.llm.answer_with_context.call_args[0][2]
+
+    def test_stalled_download_is_skipped_and_others_still_load(self):
+        start = time.perf_counter()
+        response = self.ask("hang", "fast")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["skipped_files"], ["hang.txt"])
+        self.assertEqual(response.json()["partial_files"], [])
+        # The stalled file only used its own share of the files budget
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertTrue(any("fast" in part for part in self.context()))
+        self.assertTrue(any("hang.txt was skipped" in part for part in self.context()))
+        # The LLM call kept its reserved budget
+        self.assertGreaterEqual(self.llm.answer_with_context.call_args[1]["timeout"], 0.9)
+
+    def test_download_finishing_after_deadline_is_skipped(self):
+        response = self.ask("late")
+        self.assertEqual(response.json()["skipped_files"], ["late.txt"])
+        self.assertTrue(any("could not be processed in time" in part for part in self.context()))
+
+    def test_partial_extraction_is_reported_separately(self):
+        with mock.patch("chat.views.extract", return_value=(["Filename: big.txt (Partially Extracted)"], False)):
+            response = self.ask("big")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["skipped_files"], [])
+        self.assertEqual(response.json()["partial_files"], ["big.txt"])
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILE_DIR=Path(directory.name), PROFILE_SAMPLE_RATE=0.0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch("chat.views.SharePointService.get_listing", return_value=([], '"etag"'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+
+    def test_should_profile(self):
+        request = SimpleNamespace(headers={"X-Profile": "1"}, user=SimpleNamespace(is_staff=False))
+        self.assertFalse(should_profile(request))
+        request.user.is_staff = True
+        self.assertTrue(should_profile(request))
+        request.headers = {}
+        self.assertFalse(should_profile(request))
+
+    def test_header_from_non_staff_is_ignored(self):
+        response = self.get(reverse("sharepoint-files"), HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+    def test_staff_profile_can_be_listed_and_downloaded(self):
+        self.make_staff()
+        profile_id = self.get(reverse("sharepoint-files"), HTTP_X_PROFILE="1")["X-Profile-Id"]
+
+        profiles = self.get(reverse("profile-list")).json()["profiles"]
+        self.assertEqual([p["id"] for p in profiles], [profile_id])
+        response = self.get(reverse("profile-download", args=[profile_id]))
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_profiles_require_staff(self):
+        self.assertEqual(self.get(reverse("profile-list")).status_code, 403)
+        self.assertEqual(self.get(reverse("profile-download", args=["x"])).status_code, 403)
+
+    def test_unknown_or_pruned_profile_is_not_found(self):
+        self.make_staff()
+        self.assertEqual(self.get(reverse("profile-download", args=["settings.py"])).status_code, 404)
+        # Deleted by prune_profiles() between the existence check and open()
+        with mock.patch("chat.views.profile_path", return_value=Path("/nonexistent/gone.collapsed")):
+            response = self.get(reverse("profile-download", args=["20260101T000000-x-0000abcd"]))
+        self.assertEqual(response.status_code, 404)
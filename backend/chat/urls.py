@@ -1,7 +1,15 @@
 from django.urls import path
-from .views import ChatView, SharePointFilesView
+from .views import (
+    ChatView, SharePointFilesView, SharePointTreeView, SharePointDrivesView, SharePointSearchView,
+    ProfileListView, ProfileDownloadView
+)
 
 urlpatterns = [
     path('message', ChatView.as_view(), name='chat-message'),
     path('sharepoint/files', SharePointFilesView.as_view(), name='sharepoint-files'),
+    path('sharepoint/tree', SharePointTreeView.as_view(), name='sharepoint-tree'),
+    path('sharepoint/drives', SharePointDrivesView.as_view(), name='sharepoint-drives'),
+    path('sharepoint/search', SharePointSearchView.as_view(), name='sharepoint-search'),
+    path('profiles', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:profile_id>', ProfileDownloadView.as_view(), name='profile-download'),
 ]
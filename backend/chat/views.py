@@ -2,19 +2,26 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from connectors.gemini_service import GeminiService
-from connectors.sharepoint_service import SharePointService
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from connectors.providers import get_llm_service
+from connectors.extractors import extract
+from connectors.sharepoint_service import SharePointService, listing_etag, paginate
+from connectors.deadline import Deadline, DeadlineExceeded
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-from rest_framework import status, permissions, authentication
+from rest_framework import status, permissions
 from accounts.models import SharePointCredentials
+from accounts.authentication import CachedTokenAuthentication
+from .profiling import ProfilingMixin, list_profiles, profile_path
 
 # ... imports ...
 
-class ChatView(APIView):
-    authentication_classes = [authentication.TokenAuthentication]
+class ChatView(ProfilingMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -26,6 +33,12 @@ class ChatView(APIView):
             "context_files": ["file_content_or_ref"]
         }
         """
+        # Overall budget for the request; the LLM call keeps a reserved share
+        # so slow downloads cannot starve it.
+        deadline = Deadline(getattr(settings, 'CHAT_REQUEST_TIMEOUT', 90))
+        skipped_files = []
+        # Cut short by the deadline; the model still saw what was read
+        partial_files = []
         try:
             message = request.data.get("message")
             history = request.data.get("history", [])
@@ -35,23 +48,16 @@ class ChatView(APIView):
                 return Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
 
             # Initialize Service
-            llm_service = GeminiService()
+            llm_service = get_llm_service()
             
             # Fetch content for selected files
             full_context = []
             if context_files:
                 try:
-                    sp_service = SharePointService(user=request.user)
-                    
-                    import io
-                    import mimetypes
+                    files_deadline = deadline.share(reserve=getattr(settings, 'CHAT_LLM_MIN_BUDGET', 30))
+                    sp_service = SharePointService(user=request.user, deadline=files_deadline)
 
-                    # Ensure common types are recognized
-                    mimetypes.add_type("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx")
-                    mimetypes.add_type("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")
-                    mimetypes.add_type("application/pdf", ".pdf")
-
-                    for file_obj in context_files:
+                    for index, file_obj in enumerate(context_files):
                         # Handle both string (legacy/fallback) and object formats
                         if isinstance(file_obj, str):
                              logger.warning(f"Received string filename: {file_obj}. Expected object with ID/Url.")
@@ -59,74 +65,44 @@ class ChatView(APIView):
                         
                         file_name = file_obj.get('name')
                         file_id = file_obj.get('id')
+                        drive_id = file_obj.get('driveId')
                         download_url = file_obj.get('downloadUrl')
                         
                         if not file_id and not download_url:
                              continue
 
+                        # Each file gets an equal share of what is left of the files budget
+                        file_deadline = files_deadline.share(1 / (len(context_files) - index))
+
                         try:
-                            content = sp_service.get_file_content(file_id=file_id, download_url=download_url)
+                            content = sp_service.get_file_content(
+                                file_id=file_id, download_url=download_url, drive_id=drive_id, deadline=file_deadline
+                            )
+                        except DeadlineExceeded as e:
+                            logger.warning(f"Skipping {file_name}: {e}")
+                            skipped_files.append(file_name)
+                            full_context.append(
+                                f"Note: the file {file_name} was skipped because it could not be loaded in time. "
+                                "Tell the user if the answer would have depended on it."
+                            )
+                            continue
                         except Exception as e:
                             logger.error(f"Download error for {file_name}: {e}")
                             full_context.append(f"Error downloading {file_name}: {e}")
                             content = None
 
-                        if content:
-                            lower_name = file_name.lower() if file_name else ""
-                            mime_type, _ = mimetypes.guess_type(file_name)
-                            
-                            # 1. Handle Office Documents (Text Extraction)
-                            # Gemini does not natively support DOCX/XLSX as binary parts, so we must extract text.
-                            if lower_name.endswith('.docx'):
-                                try:
-                                    from docx import Document
-                                    doc = Document(io.BytesIO(content))
-                                    text_content = "\n".join([para.text for para in doc.paragraphs])
-                                    full_context.append(f"Filename: {file_name} (Extracted Content)\n{text_content}")
-                                except Exception as docx_err:
-                                    full_context.append(f"Error reading DOCX {file_name}: {docx_err}")
-                                    
-                            elif lower_name.endswith('.xlsx'):
-                                try:
-                                    import openpyxl
-                                    wb = openpyxl.load_workbook(io.BytesIO(content), data_only=True)
-                                    text_content = ""
-                                    for sheet in wb.sheetnames:
-                                        text_content += f"Sheet: {sheet}\n"
-                                        ws = wb[sheet]
-                                        for row in ws.iter_rows(values_only=True, max_row=50):
-                                            text_content += "\t".join([str(c) if c is not None else "" for c in row]) + "\n"
-                                    full_context.append(f"Filename: {file_name} (Extracted Content)\n{text_content}")
-                                except Exception as xlsx_err:
-                                    full_context.append(f"Error reading XLSX {file_name}: {xlsx_err}")
-
-                            # 2. Handle Native Supported Types (PDF, Images)
-                            # Gemini supports valid image formats and PDF natively.
-                            elif lower_name.endswith('.pdf') or (mime_type and mime_type.startswith('image/')):
-                                if not mime_type:
-                                    # Fallback for PDF if guess failed
-                                    if lower_name.endswith('.pdf'):
-                                        mime_type = 'application/pdf'
-                                    elif lower_name.endswith('.jpg') or lower_name.endswith('.jpeg'):
-                                        mime_type = 'image/jpeg'
-                                    elif lower_name.endswith('.png'):
-                                        mime_type = 'image/png'
-                                    elif lower_name.endswith('.webp'):
-                                        mime_type = 'image/webp'
-                                
-                                full_context.append(f"Filename: {file_name}")
-                                full_context.append({
-                                    'mime_type': mime_type,
-                                    'data': content
-                                })
-
-                            # 3. Fallback: Try decoding as plain text
-                            else:
-                                try:
-                                    text_content = content.decode('utf-8', errors='ignore')
-                                    full_context.append(f"Filename: {file_name}\nContent:\n{text_content}")
-                                except:
-                                    full_context.append(f"Skipping file {file_name}: Unsupported format")
+                        if content and file_deadline.expired():
+                            # Downloaded, but nothing left for extraction
+                            skipped_files.append(file_name)
+                            full_context.append(
+                                f"Note: the file {file_name} was skipped because it could not be processed in time. "
+                                "Tell the user if the answer would have depended on it."
+                            )
+                        elif content:
+                            parts, complete = extract(file_name, content, deadline=file_deadline)
+                            full_context.extend(parts)
+                            if not complete:
+                                partial_files.append(file_name)
                         else:
                              full_context.append(f"Error reading file {file_name}: Download failed or content is empty.")
                             
@@ -136,23 +112,240 @@ class ChatView(APIView):
                     # If we really want to signal error to model, we could add a text part.
                     # full_context.append(f"Error reading file.") 
 
-            response_text = llm_service.generate_response(message, history, full_context)
+            deadline.check("LLM call")
+            response_text = llm_service.answer_with_context(
+                message, history, full_context, timeout=deadline.remaining()
+            )
 
-            return Response({"response": response_text}, status=status.HTTP_200_OK)
+            return Response(
+                {"response": response_text, "skipped_files": skipped_files, "partial_files": partial_files},
+                status=status.HTTP_200_OK
+            )
         except Exception as e:
             logger.error(f"Error in ChatView: {str(e)}")
+            if isinstance(e, DeadlineExceeded) or deadline.expired():
+                return Response(
+                    {
+                        "error": "The request ran out of time.",
+                        "skipped_files": skipped_files,
+                        "partial_files": partial_files,
+                    },
+                    status=status.HTTP_504_GATEWAY_TIMEOUT
+                )
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class SharePointFilesView(APIView):
-    authentication_classes = [authentication.TokenAuthentication]
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison as required for If-None-Match. GZipMiddleware weakens our
+    strong ETags on compressed responses, so "W/" prefixes are ignored.
+    """
+    if not if_none_match:
+        return False
+    candidates = parse_etags(if_none_match)
+    if '*' in candidates:
+        return True
+    return any(c.removeprefix('W/') == etag for c in candidates)
+
+def page_size_param(request, default=100, maximum=500):
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except ValueError:
+        raise ValueError("page_size must be an integer")
+    return max(1, min(page_size, maximum))
+
+class SharePointFilesView(ProfilingMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         try:
             folder_id = request.query_params.get('folder_id')
+            drive_id = request.query_params.get('drive_id')
             sp_service = SharePointService(user=request.user)
-            files = sp_service.list_files(folder_id=folder_id)
-            return Response({"files": files}, status=status.HTTP_200_OK)
+
+            if request.query_params.get('scope') == 'all' and not folder_id and not drive_id:
+                # Roots of every drive (OneDrive + followed sites), merged
+                items, _, failed = sp_service.list_all_drives()
+                try:
+                    files, next_cursor = paginate(
+                        items, request.query_params.get('cursor'), page_size_param(request)
+                    )
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                payload = {"files": files, "next_cursor": next_cursor, "failed_drives": failed}
+                # A partial result must not be revalidated as if it were complete
+                etag = None if failed else listing_etag(files, extra=next_cursor)
+            else:
+                files, etag = sp_service.get_listing(folder_id=folder_id, drive_id=drive_id)
+                payload = {"files": files}
+
+            if etag and etag_matches(request.headers.get('If-None-Match'), etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(payload, status=status.HTTP_200_OK)
+
+            if etag:
+                response['ETag'] = etag
+                # Let the browser keep the listing but revalidate every time
+                response['Cache-Control'] = 'private, no-cache'
+            return response
         except Exception as e:
             logger.error(f"Error listing files: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class SharePointTreeView(APIView):
+    """
+    Returns a folder subtree down to ?depth= levels in a single response.
+
+    By default the whole tree is returned as nested JSON (folders carry a
+    "children" list). With ?stream=1 the response is NDJSON, one line per
+    level as soon as that level has been expanded, followed by a final
+    {"done": true, ...} line. Folders that could not be listed are reported
+    in "failed_folders" ("failed" per level when streaming).
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            folder_id = request.query_params.get('folder_id')
+            drive_id = request.query_params.get('drive_id')
+            max_depth = getattr(settings, 'SHAREPOINT_TREE_MAX_DEPTH', 5)
+            try:
+                depth = int(request.query_params.get('depth', 2))
+            except ValueError:
+                return Response({"error": "depth must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            depth = max(1, min(depth, max_depth))
+
+            sp_service = SharePointService(user=request.user)
+            levels = sp_service.walk_tree(
+                folder_id=folder_id,
+                drive_id=drive_id,
+                depth=depth,
+                max_items=getattr(settings, 'SHAREPOINT_TREE_MAX_ITEMS', 2000),
+                max_workers=getattr(settings, 'SHAREPOINT_TREE_MAX_WORKERS', 8),
+            )
+
+            if request.query_params.get('stream') in ('1', 'true'):
+                response = StreamingHttpResponse(self._stream(levels), content_type='application/x-ndjson')
+                response['Cache-Control'] = 'no-cache'
+                return response
+
+            folders = {}
+            failed = []
+            truncated = False
+            for level in levels:
+                folders.update(level['folders'])
+                failed.extend(level['failed'])
+                truncated = level['truncated']
+            root_key = folder_id or 'root'
+            tree = self._nest(folders, root_key)
+            return Response(
+                {"files": tree, "depth": depth, "failed_folders": failed, "truncated": truncated},
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            logger.error(f"Error building folder tree: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _stream(self, levels):
+        total = 0
+        failed = 0
+        truncated = False
+        try:
+            for level in levels:
+                total += sum(len(items) for items in level['folders'].values())
+                failed += len(level['failed'])
+                truncated = level['truncated']
+                yield json.dumps(level) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming folder tree: {str(e)}")
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        finally:
+            # Client gone or done: cancel any Graph calls still queued
+            levels.close()
+        yield json.dumps({"done": True, "total": total, "failed": failed, "truncated": truncated}) + "\n"
+
+    def _nest(self, folders, parent_key):
+        # Listing dicts are shared with the listing cache, so copy before
+        # attaching children.
+        nodes = []
+        for item in folders.get(parent_key, []):
+            node = dict(item)
+            if item['type'] == 'folder' and item['id'] in folders:
+                node['children'] = self._nest(folders, item['id'])
+            nodes.append(node)
+        return nodes
+
+class SharePointDrivesView(APIView):
+    """
+    Lists the personal drive and the document libraries of followed sites.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            sp_service = SharePointService(user=request.user)
+            return Response({"drives": sp_service.list_drives()}, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error listing drives: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class SharePointSearchView(APIView):
+    """
+    Searches all drives in parallel. Results are merged in a stable order and
+    paged with an opaque ?cursor= taken from the previous page's next_cursor.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sp_service = SharePointService(user=request.user)
+            items, failed = sp_service.search(query)
+            try:
+                files, next_cursor = paginate(
+                    items, request.query_params.get('cursor'), page_size_param(request)
+                )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                {"files": files, "next_cursor": next_cursor, "failed_drives": failed},
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            logger.error(f"Error searching files: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class ProfileListView(APIView):
+    """
+    Lists recent request profiles (see chat.profiling), newest first.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"profiles": list_profiles()}, status=status.HTTP_200_OK)
+
+class ProfileDownloadView(APIView):
+    """
+    Downloads one profile as a collapsed-stack file for flamegraph.pl/speedscope.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, profile_id):
+        path = profile_path(profile_id)
+        try:
+            if path is None:
+                raise FileNotFoundError(profile_id)
+            # prune_profiles() in a concurrent request may delete it after the check
+            handle = open(path, 'rb')
+        except OSError:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(handle, as_attachment=True, filename=path.name, content_type='text/plain')
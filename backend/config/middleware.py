@@ -0,0 +1,60 @@
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # optional dependency, GZipMiddleware still applies
+    brotli = None
+
+
+def accepts_br(accept_encoding):
+    """
+    True when Accept-Encoding lists "br" with a non-zero q-value, so
+    "br;q=0" (an explicit refusal) does not count.
+    """
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() != "br":
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        return q > 0
+    return False
+
+
+class BrotliMiddleware(MiddlewareMixin):
+    """
+    Brotli-compresses large responses when the client accepts "br".
+    Must sit below GZipMiddleware in MIDDLEWARE so it sees the response
+    first; anything it leaves alone (no brotli installed, streaming
+    responses, clients without "br") falls through to gzip.
+    """
+    min_length = 200
+
+    def process_response(self, request, response):
+        if brotli is None or response.streaming:
+            return response
+        if len(response.content) < self.min_length or response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if not accepts_br(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            return response
+
+        compressed = brotli.compress(response.content, quality=5)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -10,11 +10,17 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Loaded once here for every entry point (manage.py, wsgi, asgi)
+load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -49,6 +55,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.gzip.GZipMiddleware',
+    'config.middleware.BrotliMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -132,7 +140,88 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
+
+# In-process token -> user cache used by CachedTokenAuthentication
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_CACHE_MAX_SIZE = 1024
+
+# Per-user, per-folder SharePoint listing cache (seconds / entries)
+SHAREPOINT_LISTING_CACHE_TTL = 30
+SHAREPOINT_LISTING_CACHE_MAX_SIZE = 2048
+
+# Listing, drive and subscription caches (connectors.sharepoint_service) live
+# in this cache so every worker process shares them and one Graph change
+# notification invalidates them everywhere. The file-based default is shared by
+# the workers of one host; point SHAREPOINT_CACHE_BACKEND/LOCATION at Redis
+# (django.core.cache.backends.redis.RedisCache) when running several hosts.
+SHAREPOINT_CACHE_ALIAS = 'sharepoint'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    SHAREPOINT_CACHE_ALIAS: {
+        'BACKEND': os.getenv('SHAREPOINT_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('SHAREPOINT_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'sharepoint')),
+        'OPTIONS': {'MAX_ENTRIES': SHAREPOINT_LISTING_CACHE_MAX_SIZE * 4},
+    },
+}
+
+# Limits for the recursive /api/sharepoint/tree endpoint
+SHAREPOINT_TREE_MAX_DEPTH = 5
+SHAREPOINT_TREE_MAX_ITEMS = 2000
+SHAREPOINT_TREE_MAX_WORKERS = 8
+
+# Cross-drive federation: drive list cache, per-drive Graph timeout (seconds)
+# and the number of drives queried concurrently
+SHAREPOINT_DRIVE_CACHE_TTL = 600
+SHAREPOINT_DRIVE_TIMEOUT = 10
+SHAREPOINT_FANOUT_WORKERS = 8
+SHAREPOINT_SEARCH_MAX_PAGES = 5
+
+# Per-request time budget for ChatView (seconds). CHAT_LLM_MIN_BUDGET is held
+# back from file loading for the LLM call; SHAREPOINT_DOWNLOAD_TIMEOUT applies
+# to downloads made without a deadline.
+CHAT_REQUEST_TIMEOUT = 90
+CHAT_LLM_MIN_BUDGET = 30
+SHAREPOINT_DOWNLOAD_TIMEOUT = 60
+
+# On-demand request profiling (chat.profiling). Staff can force a profile with
+# the X-Profile header; PROFILE_SAMPLE_RATE profiles a fraction of all requests.
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_FILES = 50
+
+# LLM provider (see connectors.providers). Provider SDKs and document parsers
+# are imported lazily; LLM_WARM_UP = "startup" or "after_fork" imports them
+# ahead of the first request instead.
+LLM_PROVIDER = 'gemini'
+LLM_WARM_UP = None
+
+# Map-reduce for context larger than the prompt (connectors.map_reduce). When
+# text exceeds LLM_MAX_CONTEXT_CHARS, the largest parts are cut or packed into
+# LLM_CHUNK_CHARS chunks and summarized LLM_MAP_CONCURRENCY at a time; the
+# summaries are cached by chunk hash, so follow-up questions reuse them.
+LLM_MAX_CONTEXT_CHARS = 400_000
+LLM_CHUNK_CHARS = 100_000
+LLM_MAP_CONCURRENCY = 4
+LLM_CHUNK_CACHE_TTL = 3600
+LLM_CHUNK_CACHE_MAX_SIZE = 4096
+EXTRACTION_MAX_CHARS = 5_000_000
+
+# Graph change notifications (connectors.notifications). Set
+# GRAPH_NOTIFICATION_URL to the public HTTPS URL of /api/graph/notifications to
+# enable them. Renew with `manage.py renew_graph_subscriptions` more often than
+# GRAPH_SUBSCRIPTION_RENEW_BEFORE_HOURS.
+# Subscribed drives keep listings for SHAREPOINT_SUBSCRIBED_LISTING_CACHE_TTL;
+# this relies on the shared SharePoint cache above, so do not point it at a
+# per-process backend (LocMemCache) when running several workers.
+GRAPH_NOTIFICATION_URL = os.getenv("GRAPH_NOTIFICATION_URL")
+GRAPH_SUBSCRIPTION_LIFETIME_HOURS = 72
+GRAPH_SUBSCRIPTION_RENEW_BEFORE_HOURS = 24
+GRAPH_NOTIFICATIONS_INLINE = False
+SHAREPOINT_SUBSCRIBED_LISTING_CACHE_TTL = 3600
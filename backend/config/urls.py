@@ -5,4 +5,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('chat.urls')),
     path('api/auth/', include('accounts.urls')),
+    path('api/graph/', include('connectors.urls')),
 ]
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ConnectorsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'connectors'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .providers import install_warm_up
+        install_warm_up()
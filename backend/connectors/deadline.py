@@ -0,0 +1,50 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a stage runs past the time budget it was given.
+    """
+    def __init__(self, stage="request"):
+        super().__init__(f"Time budget exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request has to finish.
+
+    Created once per request and passed down to every stage (token refresh,
+    metadata, downloads, extraction, LLM call). Stages use remaining() as
+    their I/O timeout and carve sub-deadlines out of it with share(), so a
+    slow stage can only spend its own portion of the budget.
+    """
+    def __init__(self, seconds, parent=None):
+        self.expires_at = time.monotonic() + seconds
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage="request"):
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, default=None):
+        """
+        Timeout to hand to a blocking call: the remaining budget, capped by
+        `default` when given.
+        """
+        remaining = self.remaining()
+        return remaining if default is None else min(default, remaining)
+
+    def share(self, fraction=1.0, reserve=0.0):
+        """
+        Sub-deadline covering `fraction` of what is left after holding back
+        `reserve` seconds for later stages.
+        """
+        return Deadline(max(0.0, self.remaining() - reserve) * fraction, parent=self)
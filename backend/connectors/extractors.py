@@ -0,0 +1,158 @@
+import codecs
+import importlib
+import io
+import mimetypes
+import os
+
+from django.conf import settings
+
+from .deadline import DeadlineExceeded
+
+# Ensure common types are recognized
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx")
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")
+mimetypes.add_type("application/pdf", ".pdf")
+
+# Parser libraries are imported inside the extractors that need them; this
+# list is only used by warm_up() to pay that cost ahead of the first request.
+PARSER_MODULES = ("docx", "openpyxl")
+
+TEXT_SLICE_BYTES = 1 << 20
+
+_extractors = {}
+
+
+def register_extractor(*extensions):
+    """
+    Registers an extractor for the given file extensions. Extractors take
+    (file_name, content, deadline) and return (parts, complete), where parts
+    is a list of text strings and/or {'mime_type', 'data'} dicts for the LLM.
+    """
+    def decorator(func):
+        for ext in extensions:
+            _extractors[ext.lower()] = func
+        return func
+    return decorator
+
+
+def get_extractor(file_name):
+    ext = os.path.splitext(file_name or "")[1].lower()
+    if ext in _extractors:
+        return _extractors[ext]
+    mime_type, _ = mimetypes.guess_type(file_name or "")
+    if mime_type and mime_type.startswith('image/'):
+        return extract_native
+    return extract_text
+
+
+def extract(file_name, content, deadline=None):
+    """
+    Turns downloaded file content into LLM context parts.
+    Returns (parts, complete); complete is False when the deadline cut
+    extraction short and parts only hold what was read so far.
+    """
+    return get_extractor(file_name)(file_name, content, deadline)
+
+
+def warm_up():
+    """
+    Imports the parser libraries now instead of on first use.
+    """
+    for module in PARSER_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+
+# Gemini does not natively support DOCX/XLSX as binary parts, so we must extract text.
+@register_extractor(".docx")
+def extract_docx(file_name, content, deadline=None):
+    paragraphs = []
+    try:
+        from docx import Document
+        doc = Document(io.BytesIO(content))
+        for para in doc.paragraphs:
+            if deadline:
+                deadline.check("extraction")
+            paragraphs.append(para.text)
+        text_content = "\n".join(paragraphs)
+        return [f"Filename: {file_name} (Extracted Content)\n{text_content}"], True
+    except DeadlineExceeded:
+        # Keep what was read so far rather than dropping the file
+        text_content = "\n".join(paragraphs)
+        return [f"Filename: {file_name} (Partially Extracted, time limit reached)\n{text_content}"], False
+    except Exception as docx_err:
+        return [f"Error reading DOCX {file_name}: {docx_err}"], True
+
+
+@register_extractor(".xlsx")
+def extract_xlsx(file_name, content, deadline=None):
+    # Whole sheets are read; oversized workbooks are handled by the map-reduce
+    # step in LLMInterface.answer_with_context. EXTRACTION_MAX_CHARS is only a
+    # safety net against pathological files.
+    max_chars = getattr(settings, 'EXTRACTION_MAX_CHARS', 5_000_000)
+    lines = []
+    size = 0
+    try:
+        import openpyxl
+        wb = openpyxl.load_workbook(io.BytesIO(content), data_only=True, read_only=True)
+        try:
+            for sheet in wb.sheetnames:
+                lines.append(f"Sheet: {sheet}\n")
+                ws = wb[sheet]
+                for row in ws.iter_rows(values_only=True):
+                    if deadline:
+                        deadline.check("extraction")
+                    line = "\t".join([str(c) if c is not None else "" for c in row]) + "\n"
+                    size += len(line)
+                    if size > max_chars:
+                        lines.append(f"[Truncated after {max_chars} characters]\n")
+                        return [f"Filename: {file_name} (Extracted Content)\n{''.join(lines)}"], True
+                    lines.append(line)
+        finally:
+            # Read-only workbooks keep the archive open until closed
+            wb.close()
+        return [f"Filename: {file_name} (Extracted Content)\n{''.join(lines)}"], True
+    except DeadlineExceeded:
+        # Keep what was read so far rather than dropping the file
+        return [f"Filename: {file_name} (Partially Extracted, time limit reached)\n{''.join(lines)}"], False
+    except Exception as xlsx_err:
+        return [f"Error reading XLSX {file_name}: {xlsx_err}"], True
+
+
+# Gemini supports valid image formats and PDF natively.
+@register_extractor(".pdf")
+def extract_native(file_name, content, deadline=None):
+    lower_name = file_name.lower() if file_name else ""
+    mime_type, _ = mimetypes.guess_type(file_name or "")
+    if not mime_type:
+        # Fallback for PDF if guess failed
+        if lower_name.endswith('.pdf'):
+            mime_type = 'application/pdf'
+        elif lower_name.endswith('.jpg') or lower_name.endswith('.jpeg'):
+            mime_type = 'image/jpeg'
+        elif lower_name.endswith('.png'):
+            mime_type = 'image/png'
+        elif lower_name.endswith('.webp'):
+            mime_type = 'image/webp'
+
+    return [f"Filename: {file_name}", {'mime_type': mime_type, 'data': content}], True
+
+
+# Fallback: Try decoding as plain text
+def extract_text(file_name, content, deadline=None):
+    # Decoded in slices so the deadline can cut a very large file short
+    chunks = []
+    try:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        for start in range(0, len(content), TEXT_SLICE_BYTES):
+            if deadline:
+                deadline.check("extraction")
+            chunks.append(decoder.decode(content[start:start + TEXT_SLICE_BYTES]))
+        chunks.append(decoder.decode(b"", final=True))
+        return [f"Filename: {file_name}\nContent:\n{''.join(chunks)}"], True
+    except DeadlineExceeded:
+        return [f"Filename: {file_name} (Partially Extracted, time limit reached)\nContent:\n{''.join(chunks)}"], False
+    except Exception:
+        return [f"Skipping file {file_name}: Unsupported format"], True
@@ -1,11 +1,8 @@
 import google.generativeai as genai
 import os
-from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from .llm_interface import LLMInterface
 
-load_dotenv()
-
 class GeminiService(LLMInterface):
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
@@ -23,7 +20,7 @@ class GeminiService(LLMInterface):
              self.model = genai.GenerativeModel("gemini-1.5-flash")
 
 
-    def generate_response(self, message: str, history: List[Dict[str, str]] = None, context_files: List[Any] = None) -> str:
+    def generate_response(self, message: str, history: List[Dict[str, str]] = None, context_files: List[Any] = None, timeout: Optional[float] = None) -> str:
         # Construct chat history for Gemini
         chat_history = []
         if history:
@@ -53,7 +50,8 @@ class GeminiService(LLMInterface):
         # Add text message
         user_parts.append(message)
 
-        response = chat.send_message(user_parts)
+        request_options = {"timeout": timeout} if timeout else None
+        response = chat.send_message(user_parts, request_options=request_options)
         return response.text
 
     def stream_response(self, message: str, history: List[Dict[str, str]] = None, context_files: List[str] = None):
@@ -8,7 +8,7 @@ class LLMInterface(ABC):
     """
 
     @abstractmethod
-    def generate_response(self, message: str, history: List[Dict[str, str]] = None, context_files: List[Any] = None) -> str:
+    def generate_response(self, message: str, history: List[Dict[str, str]] = None, context_files: List[Any] = None, timeout: Optional[float] = None) -> str:
         """
         Generate a response based on the message, chat history, and optional context files.
         
@@ -16,6 +16,7 @@ class LLMInterface(ABC):
             message: The user's input message.
             history: List of previous messages [{'role': 'user'/'model', 'content': '...'}].
             context_files: List of file contents or references to include in context.
+            timeout: Optional number of seconds the provider call may take.
             
         Returns:
             The model's text response.
@@ -28,3 +29,23 @@ class LLMInterface(ABC):
         Generator for streaming responses.
         """
         pass
+
+    def answer_with_context(self, message: str, history: List[Dict[str, str]] = None, context_files: List[Any] = None, timeout: Optional[float] = None) -> str:
+        """
+        Like generate_response, but switches to map-reduce (see
+        connectors.map_reduce) when the text context exceeds
+        LLM_MAX_CONTEXT_CHARS instead of sending it whole or truncating it.
+        """
+        from django.conf import settings
+        from .map_reduce import MapReduce, text_size
+
+        max_context_chars = getattr(settings, 'LLM_MAX_CONTEXT_CHARS', 400_000)
+        if text_size(context_files) <= max_context_chars:
+            return self.generate_response(message, history, context_files, timeout=timeout)
+
+        return MapReduce(
+            self,
+            max_context_chars=max_context_chars,
+            chunk_chars=getattr(settings, 'LLM_CHUNK_CHARS', 100_000),
+            concurrency=getattr(settings, 'LLM_MAP_CONCURRENCY', 4),
+        ).run(message, history, context_files, timeout=timeout)
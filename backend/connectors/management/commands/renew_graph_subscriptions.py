@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from connectors.notifications import ensure_subscriptions, renew_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Renews Graph change-notification subscriptions that are about to expire."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--subscribe',
+            action='store_true',
+            help="Also create missing subscriptions for every user with SharePoint credentials.",
+        )
+
+    def handle(self, *args, **options):
+        renewed = renew_subscriptions()
+        self.stdout.write(f"Renewed {renewed} subscription(s).")
+
+        if options['subscribe']:
+            created = 0
+            for user in User.objects.filter(sharepoint_credentials__isnull=False):
+                created += len(ensure_subscriptions(user))
+            self.stdout.write(f"{created} active subscription(s) after subscribing.")
@@ -0,0 +1,241 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from accounts.cache import TTLCache
+from .deadline import Deadline
+
+MAP_PROMPT = (
+    "Summarize part {index} of {total} of \"{label}\" so that questions about it can later be "
+    "answered from the summary alone. Keep every figure, name, date and distinct fact; drop "
+    "repetition and formatting. Stay under {limit} characters.\n\n"
+    "--- Part {index} of {total} ---\n{chunk}"
+)
+
+COMBINE_PROMPT = (
+    "The summaries below cover different parts of the user's documents. Merge them into one "
+    "shorter summary, removing repetition but keeping every figure, name, date and distinct "
+    "fact. Stay under {limit} characters.\n\n{chunk}"
+)
+
+# sha256(step + chunk) -> summary. Summaries do not depend on the question, so
+# a follow-up question on the same workbook or report reuses the map step and
+# only the final answer is generated again.
+chunk_cache = TTLCache(
+    max_size=getattr(settings, 'LLM_CHUNK_CACHE_MAX_SIZE', 4096),
+    ttl=getattr(settings, 'LLM_CHUNK_CACHE_TTL', 3600),
+)
+
+
+def chunk_key(kind, chunk):
+    digest = hashlib.sha256()
+    digest.update(kind.encode())
+    digest.update(b"\0")
+    digest.update(chunk.encode('utf-8', errors='ignore'))
+    return digest.hexdigest()
+
+
+def split_text(text, chunk_chars):
+    """
+    Splits text into chunks of at most chunk_chars, preferring line breaks so
+    spreadsheet rows and paragraphs are not cut in half.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > chunk_chars:
+            # A single oversized line: hard split it
+            if current:
+                chunks.append("".join(current))
+                current, size = [], 0
+            chunks.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        if size + len(line) > chunk_chars and current:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def text_size(context_files):
+    return sum(len(part) for part in context_files or [] if isinstance(part, str))
+
+
+class MapReduce:
+    """
+    Answers a question over context that does not fit the model's window.
+
+    The largest text parts are taken out of the context until what is left
+    fits in half of max_context_chars. Those parts are split (or, when small,
+    packed together) into chunks of up to chunk_chars. The map step has the
+    model summarize each chunk, with at most `concurrency` calls in flight.
+    Combine rounds merge the summaries while they are still too large. The
+    final generate_response call sees the remaining parts, the summaries and
+    any native (PDF/image) parts, and stays under max_context_chars of text.
+    """
+    def __init__(self, llm, max_context_chars, chunk_chars, concurrency, max_rounds=3):
+        self.llm = llm
+        self.max_context_chars = max_context_chars
+        self.chunk_chars = chunk_chars
+        self.concurrency = concurrency
+        self.max_rounds = max_rounds
+
+    def run(self, message, history=None, context_files=None, timeout=None):
+        deadline = Deadline(timeout) if timeout else None
+        # Leave the final answer at least 40% of the time budget
+        map_deadline = deadline.share(0.6) if deadline else None
+
+        kept, to_reduce = self._select(context_files or [])
+        budget = self.max_context_chars - text_size(kept)
+
+        jobs = [
+            ("map", chunk, label, MAP_PROMPT.format(
+                index=index, total=total, label=label, chunk=chunk, limit=self._summary_limit()
+            ))
+            for label, index, total, chunk in self._chunks(to_reduce)
+        ]
+        summaries = self._map(jobs, map_deadline)
+
+        rounds = 0
+        while summaries and sum(len(n) for n in summaries) > budget and rounds < self.max_rounds:
+            rounds += 1
+            groups = split_text("\n\n".join(summaries), self.chunk_chars)
+            summaries = self._map([
+                ("combine", group, f"summary group {i}", COMBINE_PROMPT.format(
+                    chunk=group, limit=self._summary_limit()
+                ))
+                for i, group in enumerate(groups, start=1)
+            ], map_deadline)
+
+        final_context = kept + self._fit(summaries, budget)
+        return self.llm.generate_response(
+            message, history, final_context, timeout=deadline.remaining() if deadline else None
+        )
+
+    def _summary_limit(self):
+        return max(1000, self.chunk_chars // 4)
+
+    def _select(self, context_files):
+        """
+        Splits the context into (kept, to_reduce). Text parts are moved to
+        to_reduce largest first until the kept text fits in half the window,
+        leaving the other half for summaries. A "Filename: ..." label directly
+        before a native part is always kept with it.
+        """
+        candidates = [
+            i for i, part in enumerate(context_files)
+            if isinstance(part, str) and not (
+                i + 1 < len(context_files) and not isinstance(context_files[i + 1], str)
+            )
+        ]
+        candidates.sort(key=lambda i: len(context_files[i]), reverse=True)
+
+        reduce_indexes = set()
+        size = text_size(context_files)
+        for i in candidates:
+            if size <= self.max_context_chars // 2:
+                break
+            reduce_indexes.add(i)
+            size -= len(context_files[i])
+
+        kept = [p for i, p in enumerate(context_files) if i not in reduce_indexes]
+        to_reduce = [context_files[i] for i in sorted(reduce_indexes)]
+        return kept, to_reduce
+
+    def _chunks(self, parts):
+        """
+        Yields (label, index, total, chunk). Parts larger than chunk_chars are
+        split; smaller ones are packed together so that many medium-sized
+        files cost few map calls.
+        """
+        packed = []
+        current = []
+        size = 0
+        for part in parts:
+            if len(part) > self.chunk_chars:
+                label = part.split("\n", 1)[0][:200]
+                chunks = split_text(part, self.chunk_chars)
+                for index, chunk in enumerate(chunks, start=1):
+                    yield label, index, len(chunks), chunk
+                continue
+            if size + len(part) > self.chunk_chars and current:
+                packed.append(current)
+                current, size = [], 0
+            current.append(part)
+            size += len(part)
+        if current:
+            packed.append(current)
+
+        for group in packed:
+            label = ", ".join(p.split("\n", 1)[0][:100] for p in group)
+            yield label, 1, 1, "\n\n".join(group)
+
+    def _fit(self, summaries, budget):
+        # Last resort when combine rounds could not shrink the summaries enough
+        fitted = []
+        used = 0
+        for summary in summaries:
+            if used + len(summary) > budget:
+                remaining = budget - used
+                if remaining > 200:
+                    fitted.append(summary[:remaining - 100] + "\n[Summary truncated to fit the context window]")
+                break
+            fitted.append(summary)
+            used += len(summary)
+        return fitted
+
+    def _ask(self, prompt, deadline):
+        # Timeout is taken when the call starts, not when it was queued
+        if deadline:
+            deadline.check("map step")
+        return self.llm.generate_response(prompt, None, None, timeout=deadline.timeout() if deadline else None)
+
+    def _map(self, jobs, deadline):
+        if not jobs:
+            return []
+
+        results = {}
+        failed = set()
+        pending = []
+        for i, (kind, chunk, label, prompt) in enumerate(jobs):
+            cached = chunk_cache.get(chunk_key(kind, chunk))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        if pending:
+            pool = ThreadPoolExecutor(max_workers=min(self.concurrency, len(pending)))
+            try:
+                futures = {pool.submit(self._ask, jobs[i][3], deadline): i for i in pending}
+                done, _ = wait(futures, timeout=deadline.remaining() if deadline else None)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+            for future, i in futures.items():
+                kind, chunk, label, _ = jobs[i]
+                if future in done and future.exception() is None:
+                    results[i] = (future.result() or "").strip()
+                    chunk_cache.set(chunk_key(kind, chunk), results[i])
+                elif kind == "combine":
+                    # Keep the summaries that went into the group; _fit trims them
+                    failed.add(i)
+                    results[i] = chunk
+                else:
+                    failed.add(i)
+                    results[i] = f"Note: {label} could not be processed in time and was left out."
+
+        summaries = []
+        for i, (kind, _, label, _) in enumerate(jobs):
+            if not results[i]:
+                continue
+            if kind == "map" and i not in failed:
+                summaries.append(f"Summary of {label}:\n{results[i]}")
+            else:
+                summaries.append(results[i])
+        return summaries
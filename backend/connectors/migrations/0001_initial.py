@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drive_id', models.CharField(blank=True, default='', max_length=255)),
+                ('subscription_id', models.CharField(max_length=255, unique=True)),
+                ('client_state', models.CharField(max_length=128)),
+                ('expires_at', models.DateTimeField()),
+                ('delta_link', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drive_subscriptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'drive_id')},
+            },
+        ),
+    ]
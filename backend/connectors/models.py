@@ -1,3 +1,22 @@
 from django.db import models
+from django.contrib.auth.models import User
 
-# Create your models here.
+class DriveSubscription(models.Model):
+    """
+    A Microsoft Graph change-notification subscription on one of a user's
+    drives. drive_id is empty for the personal drive (/me/drive).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='drive_subscriptions')
+    drive_id = models.CharField(max_length=255, blank=True, default='')
+    subscription_id = models.CharField(max_length=255, unique=True)
+    client_state = models.CharField(max_length=128)
+    expires_at = models.DateTimeField()
+    # deltaLink from the last delta pull; the next pull only returns changes since then
+    delta_link = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'drive_id')
+
+    def __str__(self):
+        return f"Graph subscription {self.subscription_id} for {self.user.username}"
@@ -0,0 +1,269 @@
+import hmac
+import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import DriveSubscription
+from .sharepoint_service import SharePointService, invalidate_listings
+
+logger = logging.getLogger(__name__)
+
+# Graph expects the webhook to answer within a few seconds, so delta pulls run
+# off the request thread.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="graph-notifications")
+
+
+def subscription_lifetime():
+    # driveItem subscriptions may last at most 42300 minutes (~29 days)
+    return timezone.timedelta(hours=getattr(settings, 'GRAPH_SUBSCRIPTION_LIFETIME_HOURS', 72))
+
+
+def ensure_subscription(user, drive_id=None):
+    """
+    Creates a change-notification subscription for the drive unless a live one
+    exists. Returns the DriveSubscription, or None when notifications are not
+    configured (GRAPH_NOTIFICATION_URL unset).
+    """
+    notification_url = getattr(settings, 'GRAPH_NOTIFICATION_URL', None)
+    if not notification_url:
+        return None
+
+    existing = DriveSubscription.objects.filter(user=user, drive_id=drive_id or '').first()
+    if existing and existing.expires_at > timezone.now():
+        return existing
+
+    service = SharePointService(user=user)
+    client_state = secrets.token_urlsafe(32)
+    expires_at = timezone.now() + subscription_lifetime()
+    # Take the delta baseline first so no change between the two calls is lost
+    _, delta_link = service.get_delta(drive_id=drive_id, latest=True)
+    data = service.create_subscription(notification_url, client_state, expires_at, drive_id=drive_id)
+
+    if existing:
+        existing.delete()
+    return DriveSubscription.objects.create(
+        user=user,
+        drive_id=drive_id or '',
+        subscription_id=data['id'],
+        client_state=client_state,
+        expires_at=expires_at,
+        delta_link=delta_link,
+    )
+
+
+def _unsubscribe(service, subscription_id):
+    close_old_connections()
+    try:
+        service.delete_subscription(subscription_id)
+    except Exception as e:
+        logger.warning(f"Could not delete subscription {subscription_id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def unsubscribe(subscription):
+    """
+    Deletes the subscription at Graph, which would otherwise keep notifying
+    until it expires. Called for every deleted DriveSubscription
+    (connectors.signals). The credentials are read now, while a user deleted
+    together with the subscription still has them; the Graph call itself
+    runs after the delete commits and off the request thread.
+    """
+    try:
+        service = SharePointService(user=subscription.user)
+    except Exception as e:
+        logger.warning(f"Could not delete subscription {subscription.subscription_id}: {e}")
+        return
+    subscription_id = subscription.subscription_id
+    if getattr(settings, 'GRAPH_NOTIFICATIONS_INLINE', False):
+        transaction.on_commit(lambda: _unsubscribe(service, subscription_id))
+    else:
+        transaction.on_commit(lambda: _executor.submit(_unsubscribe, service, subscription_id))
+
+
+def ensure_subscriptions(user):
+    """
+    Subscribes to the personal drive and to the libraries of followed sites.
+    Failures are logged per drive; the caches just keep their short TTL there.
+    """
+    service = SharePointService(user=user)
+    targets = [None]
+    try:
+        targets += [d['id'] for d in service.list_drives() if d['siteId']]
+    except Exception as e:
+        logger.error(f"Could not enumerate drives for {user.username}: {e}")
+
+    subscriptions = []
+    for drive_id in targets:
+        try:
+            subscription = ensure_subscription(user, drive_id=drive_id)
+        except Exception as e:
+            logger.error(f"Could not subscribe to drive {drive_id or 'me'} for {user.username}: {e}")
+            continue
+        if subscription:
+            subscriptions.append(subscription)
+    return subscriptions
+
+
+def _subscribe_in_background(user):
+    close_old_connections()
+    try:
+        ensure_subscriptions(user)
+    finally:
+        close_old_connections()
+
+
+def subscribe_in_background(user):
+    """
+    ensure_subscriptions() off the request thread: creating a subscription
+    makes Graph call back into our webhook, which must not hold up login.
+    """
+    if getattr(settings, 'GRAPH_NOTIFICATION_URL', None):
+        _executor.submit(_subscribe_in_background, user)
+
+
+def renew_subscriptions():
+    """
+    Extends every subscription that expires within
+    GRAPH_SUBSCRIPTION_RENEW_BEFORE_HOURS, re-creating the ones Graph has
+    dropped. Meant to run periodically (manage.py renew_graph_subscriptions).
+    """
+    renew_before = timezone.timedelta(hours=getattr(settings, 'GRAPH_SUBSCRIPTION_RENEW_BEFORE_HOURS', 24))
+    due = DriveSubscription.objects.select_related('user', 'user__sharepoint_credentials').filter(
+        expires_at__lte=timezone.now() + renew_before
+    )
+    renewed = 0
+    for subscription in due:
+        try:
+            service = SharePointService(user=subscription.user)
+            expires_at = timezone.now() + subscription_lifetime()
+            if service.renew_subscription(subscription.subscription_id, expires_at):
+                subscription.expires_at = expires_at
+                subscription.save(update_fields=['expires_at'])
+            else:
+                # Graph already dropped it; nothing to delete there
+                subscription.unsubscribe = False
+                subscription.delete()
+                ensure_subscription(subscription.user, drive_id=subscription.drive_id or None)
+                # Changes made while unsubscribed were never pushed
+                invalidate_listings(subscription.user_id)
+            renewed += 1
+        except Exception as e:
+            logger.error(f"Could not renew subscription {subscription.subscription_id}: {e}")
+    return renewed
+
+
+def fetch_delta(subscription):
+    service = SharePointService(user=subscription.user)
+    # Without a delta link (first pull or after a reset) only take a new baseline
+    return service.get_delta(
+        drive_id=subscription.drive_id or None,
+        delta_link=subscription.delta_link,
+        latest=not subscription.delta_link,
+    )
+
+
+# Swapped out by connectors.notifier.LocalNotifier in tests
+delta_fetcher = fetch_delta
+
+
+def invalidate_changes(subscription, items):
+    """
+    Drops cached listings of the folders that contain the changed items (and
+    of changed folders themselves). Delta items carry no path, so a root-level
+    change is recognised by its parent being the drive's root item.
+    """
+    root_ids = {item['id'] for item in items if 'root' in item}
+    drive_keys = {subscription.drive_id or None}
+    drive_keys.update(
+        item.get('parentReference', {}).get('driveId') for item in items
+        if item.get('parentReference', {}).get('driveId')
+    )
+
+    folders = set()
+    for item in items:
+        parent_id = item.get('parentReference', {}).get('id')
+        if parent_id:
+            folders.add(parent_id)
+            if not root_ids or parent_id in root_ids:
+                folders.add('root')
+        if 'folder' in item or 'deleted' in item:
+            folders.add(item['id'])
+
+    for drive_id in drive_keys:
+        for folder_id in folders:
+            invalidate_listings(subscription.user_id, folder_id=folder_id, drive_id=drive_id)
+    return folders
+
+
+def process_notification(notification):
+    """
+    Handles one Graph notification: checks clientState, pulls the delta for
+    the subscribed drive and invalidates the affected listings.
+    Returns False for notifications that do not match a subscription.
+    """
+    subscription = DriveSubscription.objects.select_related(
+        'user', 'user__sharepoint_credentials'
+    ).filter(subscription_id=notification.get('subscriptionId')).first()
+    if subscription is None:
+        logger.warning(f"Notification for unknown subscription {notification.get('subscriptionId')}")
+        return False
+    expected = subscription.client_state.encode()
+    if not hmac.compare_digest(expected, (notification.get('clientState') or '').encode()):
+        logger.warning(f"clientState mismatch for subscription {subscription.subscription_id}")
+        return False
+
+    try:
+        items, delta_link = delta_fetcher(subscription)
+    except Exception as e:
+        # Expired delta token or Graph error: fall back to dropping everything
+        # cached for the user; the next pull re-baselines the delta.
+        logger.error(f"Delta pull failed for {subscription.subscription_id}: {e}")
+        invalidate_listings(subscription.user_id)
+        subscription.delta_link = None
+        subscription.save(update_fields=['delta_link'])
+        return True
+
+    rebaselined = not subscription.delta_link
+    subscription.delta_link = delta_link
+    subscription.save(update_fields=['delta_link'])
+    if rebaselined:
+        # A fresh baseline returns no items, so the change behind this
+        # notification is unknown
+        invalidate_listings(subscription.user_id)
+    else:
+        invalidate_changes(subscription, items)
+    return True
+
+
+def process_notifications(notifications):
+    # Several notifications for one subscription only need one delta pull
+    seen = set()
+    for notification in notifications:
+        key = (notification.get('subscriptionId'), notification.get('clientState'))
+        if key in seen:
+            continue
+        seen.add(key)
+        try:
+            process_notification(notification)
+        except Exception as e:
+            logger.error(f"Error processing Graph notification: {e}")
+
+
+def _process_in_background(notifications):
+    close_old_connections()
+    try:
+        process_notifications(notifications)
+    finally:
+        close_old_connections()
+
+
+def dispatch(notifications):
+    if getattr(settings, 'GRAPH_NOTIFICATIONS_INLINE', False):
+        process_notifications(notifications)
+    else:
+        _executor.submit(_process_in_background, notifications)
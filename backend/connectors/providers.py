@@ -0,0 +1,53 @@
+import os
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import extractors
+
+# Provider name -> dotted path of an LLMInterface implementation. The module is
+# only imported when the provider is first used, so SDKs such as
+# google.generativeai (and its gRPC stack) stay out of worker startup.
+LLM_PROVIDERS = {
+    "gemini": "connectors.gemini_service.GeminiService",
+}
+
+
+def get_provider_class(name=None):
+    name = name or getattr(settings, 'LLM_PROVIDER', 'gemini')
+    providers = {**LLM_PROVIDERS, **getattr(settings, 'LLM_PROVIDERS', {})}
+    try:
+        return import_string(providers[name])
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider: {name}")
+
+
+def get_llm_service(name=None):
+    return get_provider_class(name)()
+
+
+def warm_up(background=False):
+    """
+    Imports the configured provider SDK and the document parsers ahead of the
+    first request. With background=True this runs in a daemon thread so a
+    freshly forked worker can start accepting requests immediately.
+    """
+    if background:
+        threading.Thread(target=warm_up, name="connectors-warm-up", daemon=True).start()
+        return
+    get_provider_class()
+    extractors.warm_up()
+
+
+def install_warm_up():
+    """
+    Applies the LLM_WARM_UP setting: None keeps everything lazy, "startup"
+    warms up in the current process, "after_fork" warms up in the background
+    in every child forked from it (e.g. preloaded gunicorn workers).
+    """
+    mode = getattr(settings, 'LLM_WARM_UP', None)
+    if mode == "startup":
+        warm_up()
+    elif mode == "after_fork" and hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: warm_up(background=True))
@@ -1,19 +1,158 @@
+import base64
+import hashlib
+import json
+import math
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
 import requests
-import msal
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
+from django.conf import settings
 from django.utils import timezone
-from accounts.msal_client import get_msal_app
+from accounts.cache import SharedCache
+from accounts.msal_client import get_msal_app, GRAPH_SCOPES
+from .deadline import DeadlineExceeded
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+_EXHAUSTED = object()
+_UNSET = object()
+
+CACHE_ALIAS = getattr(settings, 'SHAREPOINT_CACHE_ALIAS', 'sharepoint')
+
+
+class ListingCache(SharedCache):
+    """
+    SharedCache for (user_id, drive_key, folder_key) keys. Every entry is
+    scoped to its user, and merged ('*') entries additionally to the user's
+    merged results, so either group can be dropped in one call.
+    """
+    def make_key(self, key, scopes=()):
+        user_id, drive_key, _ = key
+        scopes = [('user', user_id)] + ([('merged', user_id)] if drive_key == '*' else [])
+        return super().make_key(key, scopes)
+
+    def invalidate_user(self, user_id):
+        self.invalidate_scope(('user', user_id))
+
+    def invalidate_merged(self, user_id):
+        self.invalidate_scope(('merged', user_id))
+
+
+# The caches below live in the CACHES[SHAREPOINT_CACHE_ALIAS] backend, shared
+# by every worker, so a change notification handled by one worker
+# invalidates them for all.
+
+# (user_id, drive_key, folder_key) -> (items, etag). drive_key is the drive id,
+# 'me' for the personal drive or '*' for results merged across all drives.
+# Short TTL: download URLs in the listing are pre-authenticated and expire.
+listing_cache = ListingCache(
+    alias=CACHE_ALIAS,
+    prefix='listing',
+    ttl=getattr(settings, 'SHAREPOINT_LISTING_CACHE_TTL', 30),
+)
+
+# user_id -> list of drives (personal drive + drives of followed sites)
+drive_cache = SharedCache(
+    alias=CACHE_ALIAS,
+    prefix='drives',
+    ttl=getattr(settings, 'SHAREPOINT_DRIVE_CACHE_TTL', 600),
+)
+
+# user_id -> {drive_id: expires_at} of the user's change-notification
+# subscriptions ('' is the personal drive). Dropped by the DriveSubscription
+# signal handlers in connectors.signals whenever a subscription changes.
+subscription_cache = SharedCache(
+    alias=CACHE_ALIAS,
+    prefix='subscriptions',
+    ttl=getattr(settings, 'SHAREPOINT_DRIVE_CACHE_TTL', 600),
+)
+
+
+def invalidate_listings(user_id, folder_id=None, drive_id=None):
+    """
+    Drops cached listings for a user, either for one folder or all of them.
+    Any merged (cross-drive) listing of the user is dropped as well since it
+    may contain the folder.
+    """
+    if folder_id is not None:
+        listing_cache.delete((user_id, drive_id or 'me', folder_id))
+        listing_cache.invalidate_merged(user_id)
+        return
+    drive_cache.delete(user_id)
+    listing_cache.invalidate_user(user_id)
+
+
+def listing_etag(items, extra=None):
+    """
+    Strong ETag for a folder listing, built from the Graph cTag/eTag of each
+    child. downloadUrl is left out since Graph mints a new one on every call.
+    `extra` folds in anything else the response depends on (e.g. a cursor).
+    """
+    snapshot = [
+        [item['id'], item['name'], item['type'], item.get('cTag')]
+        for item in items
+    ]
+    if extra is not None:
+        snapshot.append(extra)
+    digest = hashlib.sha256(json.dumps(snapshot, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def federated_sort_key(item):
+    # Folders first, then by name; drive and item id make ties deterministic
+    # so cursors stay valid between pages.
+    return (item['type'] != 'folder', item['name'].lower(), item.get('driveId') or '', item['id'])
+
+
+def encode_cursor(item):
+    """
+    Keyset cursor: the sort key of the last item of the page, so the next page
+    starts after it even if the list was rebuilt in between.
+    """
+    return base64.urlsafe_b64encode(json.dumps({"k": federated_sort_key(item)}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the sort key encoded in the cursor, or None for the first page.
+    """
+    if not cursor:
+        return None
+    try:
+        is_file, name, drive_id, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(is_file, bool) or not all(isinstance(v, str) for v in (name, drive_id, item_id)):
+        raise ValueError("Invalid cursor")
+    return (is_file, name, drive_id, item_id)
+
+
+def paginate(items, cursor=None, page_size=100):
+    """
+    Returns (page, next_cursor) for a list sorted by federated_sort_key. Items
+    added or removed between pages shift nothing: the page starts after the
+    cursor's key, not at an offset.
+    """
+    after = decode_cursor(cursor)
+    start = 0 if after is None else bisect_right(items, after, key=federated_sort_key)
+    page = items[start:start + page_size]
+    has_more = start + len(page) < len(items)
+    return page, encode_cursor(page[-1]) if page and has_more else None
+
 
 class SharePointService:
     """
     Connects to Microsoft SharePoint via Microsoft Graph API.
     """
-    def __init__(self, user):
+    def __init__(self, user, deadline=None):
         self.user = user
+        # Optional connectors.deadline.Deadline bounding token refresh and
+        # Graph calls made on behalf of a single request
+        self.deadline = deadline
         try:
             self.creds = user.sharepoint_credentials
         except Exception:
@@ -27,10 +166,12 @@ class SharePointService:
         if not refresh_token:
             raise Exception("No refresh token available.")
             
-        app = get_msal_app()
+        if self.deadline:
+            self.deadline.check("token refresh")
+        app = get_msal_app(timeout=self.deadline.timeout() if self.deadline else None)
         result = app.acquire_token_by_refresh_token(
             refresh_token,
-            scopes=["User.Read", "Files.Read"]
+            scopes=GRAPH_SCOPES
         )
         
         if "access_token" in result:
@@ -40,7 +181,8 @@ class SharePointService:
              if "refresh_token" in result:
                  self.creds.refresh_token = result["refresh_token"]
              
-             # Update expiry if provided (simplified)
+             # Without a new expiry every later get_token() would refresh again
+             self.creds.expires_at = timezone.now() + timezone.timedelta(seconds=result.get("expires_in", 3600))
              self.creds.save()
         else:
              raise Exception(f"Failed to refresh token: {result.get('error_description')}")
@@ -58,76 +200,543 @@ class SharePointService:
             "Content-Type": "application/json"
         }
 
-    def list_files(self, folder_id=None):
+    def _drive_url(self, drive_id=None):
+        if drive_id:
+            return f"{GRAPH_URL}/drives/{drive_id}"
+        return f"{GRAPH_URL}/me/drive"
+
+    def _get_all(self, url, timeout=None, max_pages=10):
+        """
+        GETs a Graph collection, following @odata.nextLink for up to max_pages.
+        """
+        values = []
+        for _ in range(max_pages):
+            response = requests.get(url, headers=self.get_headers(), timeout=timeout)
+            if response.status_code != 200:
+                raise Exception(f"Graph request failed: {response.status_code}, {response.text[:200]}")
+            data = response.json()
+            values.extend(data.get('value', []))
+            url = data.get('@odata.nextLink')
+            if not url:
+                break
+        return values
+
+    def list_drives(self):
+        """
+        Lists the drives visible to the user: the personal OneDrive plus the
+        document libraries of every followed SharePoint site. Site drives are
+        enumerated in parallel; sites that fail or time out are left out.
+        """
+        cached = drive_cache.get(self.user.pk)
+        if cached is not None:
+            return cached
+
+        timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+        drives = []
+        response = requests.get(f"{GRAPH_URL}/me/drive", headers=self.get_headers(), timeout=timeout)
+        complete = response.status_code == 200
+        if complete:
+            me = response.json()
+            drives.append({
+                'id': me['id'],
+                'name': me.get('name') or 'My files',
+                'driveType': me.get('driveType'),
+                'siteId': None,
+                'siteName': None,
+            })
+
+        try:
+            sites = self._get_all(f"{GRAPH_URL}/me/followedSites", timeout=timeout)
+        except Exception as e:
+            print(f"Error listing followed sites: {e}")
+            sites = []
+            complete = False
+
+        def site_drives(site):
+            values = self._get_all(f"{GRAPH_URL}/sites/{site['id']}/drives", timeout=timeout)
+            return [{
+                'id': d['id'],
+                'name': d.get('name'),
+                'driveType': d.get('driveType'),
+                'siteId': site['id'],
+                'siteName': site.get('displayName') or site.get('name'),
+            } for d in values]
+
+        results, failed = self._fan_out(site_drives, sites, key=lambda site: site['id'])
+        if failed:
+            print(f"Error listing drives for sites: {failed}")
+        for site in sites:
+            drives.extend(results.get(site['id'], []))
+
+        # Only a complete enumeration is worth caching
+        if complete and not failed:
+            drive_cache.set(self.user.pk, drives)
+        return drives
+
+    def _fan_out(self, fn, targets, key):
+        """
+        Runs fn(target) for every target concurrently. Each target gets
+        SHAREPOINT_DRIVE_TIMEOUT seconds from when its call starts, so targets
+        queued behind SHAREPOINT_FANOUT_WORKERS busy workers are not charged
+        for the wait; a single slow drive cannot hold up the others.
+
+        Returns ({key(target): result}, [keys that failed or timed out]).
+        """
+        if not targets:
+            return {}, []
+
+        # Refresh the token once here rather than racing in the workers
+        self.get_token()
+
+        timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+        max_workers = min(getattr(settings, 'SHAREPOINT_FANOUT_WORKERS', 8), len(targets))
+        # Backstop for calls that outlive their timeout and keep a worker busy
+        give_up_at = time.monotonic() + timeout * (math.ceil(len(targets) / max_workers) + 1)
+        started = {}
+
+        def run(index, target):
+            started[index] = time.monotonic()
+            return fn(target)
+
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {pool.submit(run, i, target): i for i, target in enumerate(targets)}
+            pending = set(futures)
+            expired = set()
+            done = set()
+            while pending:
+                now = time.monotonic()
+                expired |= {f for f in pending if futures[f] in started and started[futures[f]] + timeout <= now}
+                pending -= expired
+                if not pending or now >= give_up_at:
+                    break
+                deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                wait_for = min(deadlines + [give_up_at, now + timeout]) - now
+                # Expired calls are waited on too: one finishing frees a worker
+                # and starts a queued target's clock
+                finished, _ = wait(
+                    pending | {f for f in expired if not f.done()},
+                    timeout=wait_for, return_when=FIRST_COMPLETED
+                )
+                done |= finished & pending
+                pending -= finished
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        results = {}
+        failed = []
+        for future, index in futures.items():
+            target_key = key(targets[index])
+            if future in done and future.exception() is None:
+                results[target_key] = future.result()
+            else:
+                failed.append(target_key)
+        return results, failed
+
+    def list_files(self, folder_id=None, drive_id=None):
+        """
+        Lists files and folders from the user's personal drive, or from the
+        drive given by drive_id. If folder_id is provided, lists children of
+        that folder.
+        """
+        items, _ = self.get_listing(folder_id=folder_id, drive_id=drive_id)
+        return items
+
+    def get_listing(self, folder_id=None, drive_id=None, ttl=_UNSET, timeout=None):
+        """
+        Returns (items, etag) for a folder, served from the per-user listing
+        cache when possible. Failed Graph calls are not cached and return
+        ([], None). Callers that list from worker threads pass the ttl from
+        _listing_ttl() in.
+        """
+        cache_key = (self.user.pk, drive_id or 'me', folder_id or 'root')
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        items = self._fetch_listing(folder_id, drive_id=drive_id, timeout=timeout)
+        if items is None:
+            return [], None
+
+        if ttl is _UNSET:
+            ttl = self._listing_ttl(drive_id)
+        result = (items, listing_etag(items))
+        listing_cache.set(cache_key, result, ttl=ttl)
+        return result
+
+    def _listing_ttl(self, drive_id=None):
+        """
+        Drives with a live change-notification subscription are invalidated by
+        push (connectors.notifications), so their listings can be kept for
+        SHAREPOINT_SUBSCRIBED_LISTING_CACHE_TTL, but never past the
+        subscription's expiry. None means the cache's default TTL.
+        """
+        ttl = getattr(settings, 'SHAREPOINT_SUBSCRIBED_LISTING_CACHE_TTL', 3600)
+        if not ttl:
+            return None
+        expires_at = self.subscribed_drives().get(drive_id or '')
+        if expires_at is None:
+            return None
+        remaining = (expires_at - timezone.now()).total_seconds()
+        if remaining <= 0:
+            return None
+        return min(ttl, remaining)
+
+    def subscribed_drives(self):
+        """
+        {drive_id: expires_at} of the user's subscriptions, from
+        subscription_cache when possible.
+        """
+        drives = subscription_cache.get(self.user.pk)
+        if drives is None:
+            from .models import DriveSubscription
+            drives = dict(
+                DriveSubscription.objects.filter(user=self.user).values_list('drive_id', 'expires_at')
+            )
+            subscription_cache.set(self.user.pk, drives)
+        return drives
+
+    def list_all_drives(self):
+        """
+        Root listing of every drive merged into one stably ordered list.
+        Returns (items, etag, failed_drive_ids).
+        """
+        cache_key = (self.user.pk, '*', 'root')
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return cached[0], cached[1], []
+
+        drives = self.list_drives()
+        timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+
+        def drive_root(drive):
+            items = self._fetch_listing(drive_id=drive['id'], timeout=timeout)
+            if items is None:
+                raise Exception(f"Listing failed for drive {drive['id']}")
+            return items
+
+        results, failed = self._fan_out(drive_root, drives, key=lambda drive: drive['id'])
+        items = self._merge(drives, results)
+        etag = listing_etag(items)
+        if not failed:
+            listing_cache.set(cache_key, (items, etag))
+        return items, etag, failed
+
+    def search(self, query):
         """
-        Lists files and folders from the user's personal drive.
-        If folder_id is provided, lists children of that folder.
+        Searches every drive in parallel and merges the hits into one stably
+        ordered list. Returns (items, failed_drive_ids).
         """
+        cache_key = (self.user.pk, '*', ('search', query))
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return cached[0], []
+
+        drives = self.list_drives()
+        timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+        # OData string literal escaping, then percent-encoding: the query sits in
+        # the URL path, where '#', '?', '&', '/' and '%' would otherwise break it
+        escaped = quote(query.replace("'", "''"), safe='')
+
+        def drive_search(drive):
+            values = self._get_all(
+                f"{self._drive_url(drive['id'])}/root/search(q='{escaped}')",
+                timeout=timeout,
+                max_pages=getattr(settings, 'SHAREPOINT_SEARCH_MAX_PAGES', 5),
+            )
+            return [i for i in (self._normalize_item(v, drive_id=drive['id']) for v in values) if i]
+
+        results, failed = self._fan_out(drive_search, drives, key=lambda drive: drive['id'])
+        items = self._merge(drives, results)
+        if not failed:
+            listing_cache.set(cache_key, (items, None))
+        return items, failed
+
+    def _merge(self, drives, results):
+        names = {d['id']: d['name'] for d in drives}
+        merged = []
+        for drive_id, items in results.items():
+            for item in items:
+                merged.append({**item, 'driveName': names.get(drive_id)})
+        merged.sort(key=federated_sort_key)
+        return merged
+
+    def walk_tree(self, folder_id=None, depth=1, max_items=2000, max_workers=8, drive_id=None):
+        """
+        Breadth-first expansion of a folder subtree. Sibling folders at each
+        level are listed concurrently (at most max_workers Graph calls in
+        flight) and each level is yielded as soon as it completes:
+
+            {"level": 1, "folders": {parent_id: [items]}, "failed": [parent_id],
+             "truncated": False}
+
+        Folders whose listing failed or timed out (SHAREPOINT_DRIVE_TIMEOUT)
+        are reported in "failed" instead of as empty folders. Expansion stops
+        after `depth` levels or once max_items items have been returned; the
+        level that hits the cap is trimmed and flagged truncated.
+        """
+        # Resolve (and if needed refresh) the token and the listing TTL once up
+        # front so the worker threads never race each other through
+        # _authenticate or touch the database.
+        self.get_token()
+        ttl = self._listing_ttl(drive_id)
+        timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+
+        def list_level(parent_id):
+            return self.get_listing(parent_id, drive_id=drive_id, ttl=ttl, timeout=timeout)
+
+        frontier = [folder_id]
+        total = 0
+        # Not a `with` block: leaving it would wait for every queued call.
+        # Pending calls are cancelled on truncation and when the consumer
+        # closes the generator (e.g. the client disconnected).
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for level in range(1, depth + 1):
+                if not frontier:
+                    return
+
+                folders = {}
+                failed = []
+                next_frontier = []
+                truncated = False
+                queued = iter(frontier)
+                in_flight = deque()
+                exhausted = False
+                while True:
+                    # Sliding window: at most max_workers calls in flight, in
+                    # frontier order, and none once the item budget is spent.
+                    while not exhausted and len(in_flight) < max_workers and total < max_items:
+                        parent_id = next(queued, _EXHAUSTED)
+                        if parent_id is _EXHAUSTED:
+                            exhausted = True
+                        else:
+                            in_flight.append((parent_id, pool.submit(list_level, parent_id)))
+                    if not in_flight:
+                        # Folders left unlisted because the budget ran out
+                        truncated = not exhausted
+                        break
+
+                    parent_id, future = in_flight.popleft()
+                    try:
+                        items, etag = future.result()
+                    except Exception:
+                        items, etag = [], None
+                    if etag is None:
+                        failed.append(parent_id or 'root')
+                        continue
+                    remaining = max_items - total
+                    if len(items) > remaining:
+                        items = items[:remaining]
+                        truncated = True
+                    total += len(items)
+                    folders[parent_id or 'root'] = items
+                    next_frontier.extend(i['id'] for i in items if i['type'] == 'folder')
+                    if truncated:
+                        break
+
+                yield {"level": level, "folders": folders, "failed": failed, "truncated": truncated}
+                if truncated:
+                    return
+                frontier = next_frontier
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _normalize_item(self, item, drive_id=None):
+        is_file = 'file' in item
+        is_folder = 'folder' in item
+        if not (is_file or is_folder):
+            return None
+        return {
+            'name': item['name'],
+            'id': item['id'],
+            'webUrl': item['webUrl'],
+            'downloadUrl': item.get('@microsoft.graph.downloadUrl'),
+            'cTag': item.get('cTag') or item.get('eTag'),
+            'driveId': item.get('parentReference', {}).get('driveId') or drive_id,
+            'type': 'folder' if is_folder else 'file'
+        }
+
+    def _fetch_listing(self, folder_id=None, drive_id=None, timeout=None):
         if folder_id:
-             endpoint = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/children"
+             endpoint = f"{self._drive_url(drive_id)}/items/{folder_id}/children"
         else:
-             endpoint = "https://graph.microsoft.com/v1.0/me/drive/root/children"
+             endpoint = f"{self._drive_url(drive_id)}/root/children"
         
-        response = requests.get(endpoint, headers=self.get_headers())
+        response = requests.get(endpoint, headers=self.get_headers(), timeout=timeout)
         if response.status_code == 200:
             data = response.json()
             print(f"DEBUG: Graph API Response: {data}")
             items = []
             for item in data.get('value', []):
-                is_file = 'file' in item
-                is_folder = 'folder' in item
-                
-                if is_file or is_folder:
-                    items.append({
-                        'name': item['name'],
-                        'id': item['id'],
-                        'webUrl': item['webUrl'],
-                        'downloadUrl': item.get('@microsoft.graph.downloadUrl'),
-                        'type': 'folder' if is_folder else 'file'
-                    })
+                normalized = self._normalize_item(item, drive_id=drive_id)
+                if normalized:
+                    items.append(normalized)
             print(f"DEBUG: Found {len(items)} items")
             return items
         else:
             print(f"Error listing items: {response.text}")
-            return []
+            return None
 
-    def get_file_content(self, file_id=None, download_url=None):
+    def get_file_content(self, file_id=None, download_url=None, drive_id=None, deadline=None):
         """
         Downloads file content.
 
         If download_url is provided (from list_files), use it.
-        Otherwise, fetch the item to get the URL first.
+        Otherwise, fetch the item to get the URL first. A listing revalidated
+        with a 304 can hand back an expired download_url, so a failed download
+        is retried once with a freshly fetched URL when file_id is known.
+
+        With a deadline, metadata and download share its budget and
+        DeadlineExceeded is raised (not swallowed) once it runs out.
         """
         try:
             # Step 1: Fetch download URL if not provided
+            stale_url_possible = bool(download_url)
             if not download_url:
-                if not file_id:
-                    raise ValueError("Either file_id or download_url must be provided")
-
-                endpoint = f"https://graph.microsoft.com/v1.0/me/drive/items/{file_id}"
-                resp = requests.get(endpoint, headers=self.get_headers())
-
-                if resp.status_code != 200:
-                    raise Exception(
-                        f"Failed to fetch file metadata: {resp.status_code}, {resp.text[:200]}"
-                    )
-
-                download_url = resp.json().get('@microsoft.graph.downloadUrl')
-                if not download_url:
-                    raise Exception("Download URL not found in metadata")
+                download_url = self._fetch_download_url(file_id, drive_id=drive_id, deadline=deadline)
 
             # Step 2: Download file content
-            file_resp = requests.get(download_url)
-            if file_resp.status_code == 200:
-                return file_resp.content
+            status_code, body = self._download(download_url, deadline)
+            if status_code != 200 and file_id and stale_url_possible:
+                status_code, body = self._download(
+                    self._fetch_download_url(file_id, drive_id=drive_id, deadline=deadline), deadline
+                )
+
+            if status_code == 200:
+                return body
             else:
                 raise Exception(
-                    f"Error downloading file: {file_resp.status_code}, {file_resp.text[:200]}"
+                    f"Error downloading file: {status_code}, {body[:200]}"
                 )
 
+        except DeadlineExceeded:
+            raise
+        except requests.Timeout:
+            if deadline and deadline.expired():
+                raise DeadlineExceeded("download")
+            print(f"Timed out downloading file {file_id}")
+            return None
         except Exception as e:
             print(f"Exception downloading file: {e}")
             return None
 
         
         return None
+
+    def _download(self, url, deadline=None):
+        """
+        Streams a download so the deadline is enforced on the whole transfer,
+        not just on each socket read. Returns (status_code, bytes or error text).
+        """
+        default_timeout = getattr(settings, 'SHAREPOINT_DOWNLOAD_TIMEOUT', 60)
+        timeout = deadline.timeout(default_timeout) if deadline else default_timeout
+        if deadline:
+            deadline.check("download")
+
+        with requests.get(url, stream=True, timeout=timeout) as resp:
+            if resp.status_code != 200:
+                return resp.status_code, resp.text
+            chunks = []
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                if deadline:
+                    deadline.check("download")
+                chunks.append(chunk)
+            return resp.status_code, b"".join(chunks)
+
+    def _fetch_download_url(self, file_id, drive_id=None, deadline=None):
+        if not file_id:
+            raise ValueError("Either file_id or download_url must be provided")
+
+        default_timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+        if deadline:
+            deadline.check("metadata")
+        endpoint = f"{self._drive_url(drive_id)}/items/{file_id}"
+        resp = requests.get(
+            endpoint,
+            headers=self.get_headers(),
+            timeout=deadline.timeout(default_timeout) if deadline else default_timeout
+        )
+
+        if resp.status_code != 200:
+            raise Exception(
+                f"Failed to fetch file metadata: {resp.status_code}, {resp.text[:200]}"
+            )
+
+        download_url = resp.json().get('@microsoft.graph.downloadUrl')
+        if not download_url:
+            raise Exception("Download URL not found in metadata")
+        return download_url
+
+    def create_subscription(self, notification_url, client_state, expires_at, drive_id=None):
+        """
+        Subscribes to change notifications for a drive. Graph calls
+        notification_url to validate it before this returns.
+        """
+        resource = f"/drives/{drive_id}/root" if drive_id else "/me/drive/root"
+        response = requests.post(
+            f"{GRAPH_URL}/subscriptions",
+            headers=self.get_headers(),
+            json={
+                "changeType": "updated",
+                "notificationUrl": notification_url,
+                "resource": resource,
+                "expirationDateTime": expires_at.isoformat(),
+                "clientState": client_state,
+            },
+            timeout=getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10),
+        )
+        if response.status_code != 201:
+            raise Exception(f"Failed to create subscription: {response.status_code}, {response.text[:200]}")
+        return response.json()
+
+    def renew_subscription(self, subscription_id, expires_at):
+        """
+        Extends a subscription. Returns False if Graph no longer knows it.
+        """
+        response = requests.patch(
+            f"{GRAPH_URL}/subscriptions/{subscription_id}",
+            headers=self.get_headers(),
+            json={"expirationDateTime": expires_at.isoformat()},
+            timeout=getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10),
+        )
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            raise Exception(f"Failed to renew subscription: {response.status_code}, {response.text[:200]}")
+        return True
+
+    def delete_subscription(self, subscription_id):
+        """
+        Deletes a subscription; one Graph no longer knows counts as deleted.
+        """
+        response = requests.delete(
+            f"{GRAPH_URL}/subscriptions/{subscription_id}",
+            headers=self.get_headers(),
+            timeout=getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10),
+        )
+        if response.status_code not in (204, 404):
+            raise Exception(f"Failed to delete subscription: {response.status_code}, {response.text[:200]}")
+
+    def get_delta(self, drive_id=None, delta_link=None, latest=False):
+        """
+        Pulls changed items since delta_link (or from scratch). With latest=True
+        no items are returned, only a deltaLink marking "now".
+        Returns (raw Graph items, new delta_link).
+        """
+        url = delta_link or f"{self._drive_url(drive_id)}/root/delta"
+        if latest and not delta_link:
+            url += "?token=latest"
+
+        timeout = getattr(settings, 'SHAREPOINT_DRIVE_TIMEOUT', 10)
+        items = []
+        while url:
+            response = requests.get(url, headers=self.get_headers(), timeout=timeout)
+            if response.status_code != 200:
+                raise Exception(f"Delta query failed: {response.status_code}, {response.text[:200]}")
+            data = response.json()
+            items.extend(data.get('value', []))
+            if '@odata.deltaLink' in data:
+                return items, data['@odata.deltaLink']
+            url = data.get('@odata.nextLink')
+        return items, delta_link
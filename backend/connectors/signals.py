@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import DriveSubscription
+from .notifications import unsubscribe
+from .sharepoint_service import subscription_cache
+
+
+@receiver([post_save, post_delete], sender=DriveSubscription)
+def subscription_changed(sender, instance, **kwargs):
+    subscription_cache.delete(instance.user_id)
+
+
+@receiver(pre_delete, sender=DriveSubscription)
+def subscription_deleted(sender, instance, **kwargs):
+    # Callers set unsubscribe = False when Graph no longer knows the
+    # subscription (renew_subscriptions got a 404)
+    if getattr(instance, 'unsubscribe', True):
+        unsubscribe(instance)
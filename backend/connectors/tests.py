@@ -1,3 +1,483 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import SharePointCredentials
+from .deadline import Deadline, DeadlineExceeded
+from .extractors import extract
+from .llm_interface import LLMInterface
+from .map_reduce import chunk_cache, text_size
+from .models import DriveSubscription
+from .notifications import renew_subscriptions
+from .notifier import LocalNotifier
+from .sharepoint_service import (
+    ListingCache, SharePointService, decode_cursor, encode_cursor, federated_sort_key, invalidate_listings,
+    listing_cache, paginate,
+)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Boots Django and loads the URLconf (and with it every view module) in a
+# fresh interpreter, the same work a new worker does before serving.
+COLD_START_SCRIPT = """
+import json, os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+start = time.perf_counter()
+import django
+django.setup()
+import config.urls
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("google.generativeai", "grpc", "openpyxl", "docx", "msal") if m in sys.modules]
+print(json.dumps({"elapsed": elapsed, "heavy": heavy}))
+"""
+
+
+class ColdStartImportTests(SimpleTestCase):
+    """
+    Import-time benchmark: fails when worker cold start regresses, either
+    because a provider SDK / parser is imported eagerly again or because
+    startup exceeds COLD_START_BUDGET seconds.
+    """
+    budget = float(os.getenv("COLD_START_BUDGET", "2.5"))
+
+    def cold_start(self):
+        result = subprocess.run(
+            [sys.executable, "-c", COLD_START_SCRIPT],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_heavy_modules_are_lazy(self):
+        self.assertEqual(self.cold_start()["heavy"], [])
+
+    def test_cold_start_within_budget(self):
+        # Best of three to keep a noisy machine from failing the build
+        elapsed = min(self.cold_start()["elapsed"] for _ in range(3))
+        self.assertLess(elapsed, self.budget, f"Cold start took {elapsed:.2f}s (budget {self.budget}s)")
+
+
+class GraphNotificationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user@example.com")
+        SharePointCredentials.objects.create(user=self.user, access_token="token")
+        self.subscription = DriveSubscription.objects.create(
+            user=self.user,
+            subscription_id="sub-1",
+            client_state="secret-state",
+            expires_at=timezone.now() + timezone.timedelta(days=1),
+            delta_link="https://graph.microsoft.com/v1.0/me/drive/root/delta?token=1",
+        )
+        listing_cache.clear()
+        for folder in ("root", "folder-a", "folder-b"):
+            listing_cache.set((self.user.pk, "me", folder), ([], '"etag"'))
+
+    def cached(self, folder):
+        return listing_cache.get((self.user.pk, "me", folder)) is not None
+
+    def test_validation_handshake_echoes_token(self):
+        with LocalNotifier() as notifier:
+            response = notifier.validate("abc123")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"abc123")
+        self.assertEqual(response["Content-Type"], "text/plain")
+
+    def test_notification_invalidates_only_changed_folders(self):
+        with LocalNotifier() as notifier:
+            notifier.change(self.subscription, {
+                "id": "file-1", "file": {}, "parentReference": {"id": "folder-a"},
+            }, {
+                "id": "root-id", "root": {}, "folder": {},
+            })
+            response = notifier.notify(self.subscription)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(self.cached("folder-a"))
+        self.assertTrue(self.cached("folder-b"))
+        self.assertTrue(self.cached("root"))
+        self.subscription.refresh_from_db()
+        self.assertTrue(self.subscription.delta_link.startswith("local-delta-"))
+
+    def test_client_state_mismatch_is_ignored(self):
+        with LocalNotifier() as notifier:
+            notifier.change(self.subscription, {
+                "id": "file-1", "file": {}, "parentReference": {"id": "folder-a"},
+            })
+            notifier.notify(self.subscription, client_state="forged")
+
+        self.assertTrue(self.cached("folder-a"))
+
+    def test_listing_ttl_does_not_query_per_listing(self):
+        service = SharePointService(user=self.user)
+        self.assertEqual(service._listing_ttl(), 3600)
+        with self.assertNumQueries(0):
+            self.assertEqual(service._listing_ttl(), 3600)
+            self.assertIsNone(service._listing_ttl("other-drive"))
+
+    def test_subscription_changes_refresh_ttl(self):
+        service = SharePointService(user=self.user)
+        self.assertEqual(service._listing_ttl(), 3600)
+        self.subscription.delete()
+        self.assertIsNone(service._listing_ttl())
+
+    @override_settings(SHAREPOINT_SUBSCRIBED_LISTING_CACHE_TTL=None)
+    def test_long_ttl_can_be_disabled(self):
+        self.assertIsNone(SharePointService(user=self.user)._listing_ttl())
+
+    def test_invalidation_reaches_other_workers(self):
+        # A second ListingCache on the same backend stands in for another
+        # worker process
+        other_worker = ListingCache(alias=listing_cache.alias, prefix=listing_cache.prefix)
+        self.assertIsNotNone(other_worker.get((self.user.pk, "me", "folder-a")))
+        other_worker.set((self.user.pk, "*", "root"), ([], None))
+
+        invalidate_listings(self.user.pk, folder_id="folder-a")
+        self.assertIsNone(other_worker.get((self.user.pk, "me", "folder-a")))
+        self.assertIsNone(other_worker.get((self.user.pk, "*", "root")))
+        self.assertTrue(self.cached("folder-b"))
+
+        invalidate_listings(self.user.pk)
+        self.assertIsNone(other_worker.get((self.user.pk, "me", "folder-b")))
+
+    @override_settings(GRAPH_NOTIFICATIONS_INLINE=True)
+    def test_deleted_subscription_is_removed_from_graph_after_commit(self):
+        with mock.patch.object(SharePointService, "delete_subscription") as delete_subscription:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.subscription.delete()
+                delete_subscription.assert_not_called()
+        delete_subscription.assert_called_once_with("sub-1")
+
+    @override_settings(GRAPH_NOTIFICATIONS_INLINE=True)
+    def test_renew_does_not_delete_subscription_graph_dropped(self):
+        DriveSubscription.objects.filter(pk=self.subscription.pk).update(expires_at=timezone.now())
+        with mock.patch.object(SharePointService, "renew_subscription", return_value=False), \
+                mock.patch.object(SharePointService, "delete_subscription") as delete_subscription, \
+                mock.patch("connectors.notifications.ensure_subscription") as ensure_subscription:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(renew_subscriptions(), 1)
+        delete_subscription.assert_not_called()
+        ensure_subscription.assert_called_once_with(self.user, drive_id=None)
+        self.assertFalse(DriveSubscription.objects.exists())
+
+
+class FakeLLM(LLMInterface):
+    """
+    Records every call; map/combine prompts get a 2000-character summary.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def generate_response(self, message, history=None, context_files=None, timeout=None):
+        self.calls.append((message, context_files))
+        if context_files is None:
+            return "s" * 2000
+        return "answer"
+
+    def stream_response(self, message, history=None, context_files=None):
+        yield self.generate_response(message, history, context_files)
+
+
+@override_settings(LLM_MAX_CONTEXT_CHARS=400_000, LLM_CHUNK_CHARS=100_000, LLM_MAP_CONCURRENCY=2)
+class MapReduceTests(SimpleTestCase):
+    def setUp(self):
+        chunk_cache.clear()
+        # Ten medium-sized files: none is larger than a chunk, together they
+        # are twice the window
+        self.context = [f"Filename: report-{i}.xlsx\n" + "x" * 81_000 for i in range(10)]
+
+    def test_final_call_fits_the_window(self):
+        llm = FakeLLM()
+        self.assertEqual(llm.answer_with_context("total?", context_files=self.context), "answer")
+
+        message, final_context = llm.calls[-1]
+        self.assertEqual(message, "total?")
+        self.assertLessEqual(text_size(final_context), 400_000)
+        self.assertGreater(len(llm.calls), 1)
+
+    def test_failed_combine_keeps_map_summaries(self):
+        class FailingCombine(FakeLLM):
+            def generate_response(self, message, history=None, context_files=None, timeout=None):
+                if message.startswith("The summaries below"):
+                    raise RuntimeError("combine failed")
+                if context_files is None:
+                    self.calls.append((message, None))
+                    return "s" * 45_000
+                return super().generate_response(message, history, context_files, timeout)
+
+        llm = FailingCombine()
+        llm.answer_with_context("total?", context_files=[
+            f"Filename: report-{i}.xlsx\n" + "x" * 95_000 for i in range(10)
+        ])
+
+        _, final_context = llm.calls[-1]
+        self.assertLessEqual(text_size(final_context), 400_000)
+        self.assertTrue(any(part.startswith("Summary of") for part in final_context))
+        self.assertFalse(any("could not be processed" in part for part in final_context))
+
+    def test_follow_up_question_reuses_summaries(self):
+        FakeLLM().answer_with_context("total?", context_files=self.context)
+
+        llm = FakeLLM()
+        llm.answer_with_context("and the average?", context_files=self.context)
+        self.assertEqual([message for message, _ in llm.calls], ["and the average?"])
+
+
+class WalkTreeTests(TestCase):
+    """
+    walk_tree against a fake get_listing: root holds six folders f0..f5 with
+    three files each.
+    """
+    def setUp(self):
+        listing_cache.clear()
+        self.user = User.objects.create(username="user@example.com")
+        SharePointCredentials.objects.create(user=self.user, access_token="token")
+        self.service = SharePointService(user=self.user)
+        self.service.get_token = lambda: "token"
+        self.service.get_listing = self.get_listing
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.delay = 0
+        self.failing = set()
+        self.release = None
+
+    def get_listing(self, folder_id=None, drive_id=None, ttl=None, timeout=None):
+        with self.lock:
+            self.calls.append(folder_id)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.release and folder_id == "f3":
+                self.release.wait(5)
+            time.sleep(self.delay)
+            if folder_id in self.failing:
+                return [], None
+            if folder_id is None:
+                items = [{"id": f"f{i}", "type": "folder"} for i in range(6)]
+            else:
+                items = [{"id": f"{folder_id}-{i}", "type": "file"} for i in range(3)]
+            return items, '"etag"'
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def test_sliding_window_bounds_concurrency_and_keeps_order(self):
+        self.delay = 0.02
+        levels = list(self.service.walk_tree(depth=2, max_workers=2))
+
+        self.assertEqual(len(levels), 2)
+        self.assertLessEqual(self.max_active, 2)
+        self.assertEqual(list(levels[1]["folders"]), [f"f{i}" for i in range(6)])
+        self.assertFalse(levels[1]["truncated"])
+
+    def test_max_items_truncates_and_stops_listing(self):
+        levels = list(self.service.walk_tree(depth=3, max_items=10, max_workers=1))
+
+        self.assertEqual(len(levels), 2)
+        self.assertTrue(levels[1]["truncated"])
+        self.assertEqual(sum(len(items) for items in levels[1]["folders"].values()), 4)
+        self.assertEqual(self.calls, [None, "f0", "f1"])
+
+    def test_failed_listing_is_reported_not_empty(self):
+        self.failing = {"f2"}
+        levels = list(self.service.walk_tree(depth=2, max_workers=3))
+
+        self.assertEqual(levels[1]["failed"], ["f2"])
+        self.assertNotIn("f2", levels[1]["folders"])
+        self.assertEqual(levels[0]["failed"], [])
+
+    def test_truncation_does_not_wait_for_calls_in_flight(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        start = time.perf_counter()
+        levels = list(self.service.walk_tree(depth=2, max_items=8, max_workers=4))
+
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertTrue(levels[-1]["truncated"])
+
+    def test_close_stops_further_listing(self):
+        levels = self.service.walk_tree(depth=3, max_workers=2)
+        self.assertEqual(next(levels)["level"], 1)
+        levels.close()
+
+        with self.assertRaises(StopIteration):
+            next(levels)
+        time.sleep(0.05)
+        self.assertEqual(self.calls, [None])
+
+
+def item(name, type="file", drive_id="d1", id=None):
+    return {"id": id or f"{drive_id}-{name}", "name": name, "type": type, "driveId": drive_id}
+
+
+class PaginationTests(SimpleTestCase):
+    def setUp(self):
+        self.items = sorted([item(f"file-{i:02}") for i in range(10)], key=federated_sort_key)
+
+    def test_pages_cover_every_item_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = paginate(self.items, cursor, page_size=3)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.items)
+
+    def test_cursor_survives_rebuilt_list(self):
+        page, cursor = paginate(self.items, page_size=4)
+        self.assertEqual(page[-1]["name"], "file-03")
+
+        # Between pages an earlier item goes away and another one shows up
+        rebuilt = sorted(
+            [i for i in self.items if i["name"] != "file-01"] + [item("file-00a")],
+            key=federated_sort_key,
+        )
+        page, _ = paginate(rebuilt, cursor, page_size=4)
+        self.assertEqual([i["name"] for i in page], ["file-04", "file-05", "file-06", "file-07"])
+
+    def test_last_page_has_no_cursor(self):
+        _, cursor = paginate(self.items, page_size=10)
+        self.assertIsNone(cursor)
+        self.assertEqual(paginate([], page_size=10), ([], None))
+
+    def test_decode_cursor(self):
+        self.assertIsNone(decode_cursor(None))
+        self.assertEqual(decode_cursor(encode_cursor(self.items[2])), federated_sort_key(self.items[2]))
+        for bad in ("not-base64!", "e30=", encode_cursor(self.items[0])[:-4]):
+            with self.assertRaises(ValueError):
+                decode_cursor(bad)
+
+    def test_merge_orders_folders_first_then_name_then_drive(self):
+        drives = [{"id": "d1", "name": "OneDrive"}, {"id": "d2", "name": "Team Site"}]
+        results = {
+            "d2": [item("budget.xlsx", drive_id="d2"), item("Archive", type="folder", drive_id="d2")],
+            "d1": [item("Budget.xlsx", drive_id="d1"), item("notes.txt", drive_id="d1")],
+        }
+        merged = SharePointService._merge(None, drives, results)
+
+        self.assertEqual(
+            [(i["name"], i["driveName"]) for i in merged],
+            [("Archive", "Team Site"), ("Budget.xlsx", "OneDrive"),
+             ("budget.xlsx", "Team Site"), ("notes.txt", "OneDrive")],
+        )
+
+
+@override_settings(SHAREPOINT_DRIVE_TIMEOUT=0.3, SHAREPOINT_FANOUT_WORKERS=2)
+class FanOutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user@example.com")
+        SharePointCredentials.objects.create(user=self.user, access_token="token")
+        self.service = SharePointService(user=self.user)
+        self.service.get_token = lambda: "token"
+
+    def test_queued_drives_get_their_own_timeout(self):
+        # Six drives at 0.2s each through two workers take 0.6s in total,
+        # but no single drive is slower than the 0.3s timeout
+        def list_drive(drive):
+            time.sleep(0.2)
+            return drive
+
+        results, failed = self.service._fan_out(list_drive, list(range(6)), key=lambda drive: drive)
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(results), list(range(6)))
+
+    def test_slow_drive_fails_alone(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def list_drive(drive):
+            if drive == "slow":
+                release.wait(5)
+            return drive
+
+        results, failed = self.service._fan_out(list_drive, ["slow", "a", "b", "c"], key=lambda drive: drive)
+        self.assertEqual(failed, ["slow"])
+        self.assertEqual(sorted(results), ["a", "b", "c"])
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_remaining_and_expiry(self):
+        deadline = Deadline(10)
+        self.assertGreater(deadline.remaining(), 9)
+        self.assertFalse(deadline.expired())
+        deadline.check()
+
+        expired = Deadline(0)
+        self.assertEqual(expired.remaining(), 0)
+        with self.assertRaises(DeadlineExceeded) as raised:
+            expired.check("download")
+        self.assertEqual(raised.exception.stage, "download")
+
+    def test_timeout_is_capped(self):
+        deadline = Deadline(10)
+        self.assertEqual(deadline.timeout(default=2), 2)
+        self.assertGreater(deadline.timeout(), 9)
+
+    def test_share_holds_back_reserve(self):
+        deadline = Deadline(10)
+        share = deadline.share(0.5, reserve=4)
+        self.assertAlmostEqual(share.remaining(), 3, delta=0.1)
+        self.assertEqual(deadline.share(reserve=20).remaining(), 0)
+
+    def test_share_never_outlives_parent(self):
+        parent = Deadline(1)
+        self.assertLessEqual(Deadline(10, parent=parent).expires_at, parent.expires_at)
+        self.assertLessEqual(parent.share(2).expires_at, parent.expires_at)
+
+
+class CheckCounter:
+    """
+    Deadline stand-in that expires after `checks` calls to check().
+    """
+    def __init__(self, checks):
+        self.checks = checks
+
+    def check(self, stage="request"):
+        self.checks -= 1
+        if self.checks < 0:
+            raise DeadlineExceeded(stage)
+
+
+class ExtractionDeadlineTests(SimpleTestCase):
+    def test_text_without_deadline_is_complete(self):
+        parts, complete = extract("notes.txt", "héllo".encode())
+        self.assertTrue(complete)
+        self.assertIn("héllo", parts[0])
+
+    @mock.patch("connectors.extractors.TEXT_SLICE_BYTES", 4)
+    def test_text_is_cut_short_by_deadline(self):
+        parts, complete = extract("notes.txt", b"aaaabbbbcccc", deadline=CheckCounter(2))
+        self.assertFalse(complete)
+        self.assertIn("Partially Extracted", parts[0])
+        self.assertTrue(parts[0].endswith("aaaabbbb"))
+
+    def test_xlsx_workbook_is_closed(self):
+        sheet = SimpleNamespace(iter_rows=lambda values_only: iter([("a", 1), ("b", 2), ("c", 3)]))
+        workbook = mock.MagicMock(sheetnames=["Sheet1"])
+        workbook.__getitem__.return_value = sheet
+        openpyxl = SimpleNamespace(load_workbook=lambda *args, **kwargs: workbook)
+        with mock.patch.dict(sys.modules, {"openpyxl": openpyxl}):
+            parts, complete = extract("book.xlsx", b"", deadline=CheckCounter(1))
+
+        self.assertFalse(complete)
+        self.assertIn("a\t1", parts[0])
+        workbook.close.assert_called_once()
+
+    def test_docx_is_cut_short_by_deadline(self):
+        document = SimpleNamespace(paragraphs=[SimpleNamespace(text=f"paragraph {i}") for i in range(5)])
+        with mock.patch.dict(sys.modules, {"docx": SimpleNamespace(Document=lambda f: document)}):
+            parts, complete = extract("report.docx", b"", deadline=CheckCounter(2))
+        self.assertFalse(complete)
+        self.assertIn("paragraph 1", parts[0])
+        self.assertNotIn("paragraph 2", parts[0])
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import GraphNotificationView
+
+urlpatterns = [
+    path('notifications', GraphNotificationView.as_view(), name='graph-notifications'),
+]
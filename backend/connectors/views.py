@@ -1,3 +1,31 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from . import notifications
+
+
+class GraphNotificationView(APIView):
+    """
+    Webhook for Microsoft Graph change notifications.
+
+    Graph first validates the URL by POSTing ?validationToken=..., which has to
+    be echoed back as text/plain. Real notifications are acknowledged with 202
+    straight away; clientState checks, delta pulls and cache invalidation run
+    in connectors.notifications.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        validation_token = request.query_params.get('validationToken')
+        if validation_token is not None:
+            return HttpResponse(validation_token, content_type='text/plain')
+
+        value = request.data.get('value') if isinstance(request.data, dict) else None
+        if not isinstance(value, list):
+            return Response({"error": "Expected a notification collection"}, status=status.HTTP_400_BAD_REQUEST)
+
+        notifications.dispatch([n for n in value if isinstance(n, dict)])
+        return Response(status=status.HTTP_202_ACCEPTED)
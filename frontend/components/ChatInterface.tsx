@@ -50,7 +50,16 @@ export default function ChatInterface({ selectedFiles, isSidebarOpen, toggleSide
         context_files: selectedFiles 
       });
 
-      const botMsg: Message = { role: 'model', content: res.data.response };
+      const skipped: string[] = res.data.skipped_files || [];
+      const partial: string[] = res.data.partial_files || [];
+      let note = '';
+      if (skipped.length > 0) {
+        note += `\n\n_Skipped (time limit reached): ${skipped.join(', ')}_`;
+      }
+      if (partial.length > 0) {
+        note += `\n\n_Only partially read (time limit reached): ${partial.join(', ')}_`;
+      }
+      const botMsg: Message = { role: 'model', content: res.data.response + note };
       setMessages(prev => [...prev, botMsg]);
     } catch (error) {
       console.error("Chat error", error);